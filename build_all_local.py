@@ -1,7 +1,10 @@
-import subprocess, os, sys
+import subprocess, os, sys, threading, time, multiprocessing, re
 
 # python build_all.py > build_all.log
 #
+# python build_all_local.py linux -j 4    (4 configurations at a time, sharing the cores)
+# python build_all_local.py linux --dry-run    (only print which configurations would be built)
+#
 # MSVC++ 4.x  _MSC_VER == 1000
 # MSVC++ 5.0  _MSC_VER == 1100
 # MSVC++ 6.0  _MSC_VER == 1200
@@ -17,9 +20,155 @@ import subprocess, os, sys
 #  
 
 def usage():
-    print("Usage: %s [win | linux | macosx]" % sys.argv[0]) 
+    print("Usage: %s [win | linux | macosx] [-j parallel_builds] [--dry-run]" % sys.argv[0])
+
+class Job(object):
+    def __init__(self, cmd, log, settings, options, env=None):
+        self.cmd = " ".join(cmd.split())
+        self.log = log
+        # the -s/-o values of the command, used to plan which packages are built
+        self.settings = settings
+        self.options = options
+        self.env = env or {}
+        self.status = "not run"
+        self.duration = 0.0
+
+def read_recipe():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "conanfile.py")) as recipe:
+        return recipe.read()
+
+def package_id_insensitive_options(recipe):
+    # the options IcuConan.package_id() sets to "any" give the same package whatever their value
+    return set(re.findall(r'self\.info\.options\.(\w+) = "any"', recipe))
+
+def recipe_default_options(recipe):
+    # the "name=value" strings of IcuConan.default_options
+    block = re.search(r'default_options = (.*?)\n\s*\n', recipe, re.S).group(1)
+    return dict(re.findall(r'"(\w+)=([^"]*)"', block))
+
+def package_options(job, default_options, insensitive_options):
+    # every option in the package id with the job's value, the recipe's default otherwise, so
+    # packages built with non default options (with_pgo, cpu_target...) don't count as this one
+    options = dict(default_options)
+    options.update((name, str(value)) for name, value in job.options.items())
+    return sorted(item for item in options.items() if item[0] not in insensitive_options)
+
+def profile_settings(profile):
+    # the [settings] of a conan profile (and the icu:... package settings), as `conan profile show` prints them
+    output = subprocess.check_output("conan profile show %s" % profile, shell=True).decode('utf-8', 'replace')
+    settings = {}
+    section = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+        elif section == "settings" and "=" in line:
+            name, value = line.split("=", 1)
+            if ":" in name:
+                package, name = name.split(":", 1)
+                if package != "icu":
+                    continue
+            settings[name.strip()] = value.strip()
+    return settings
+
+def package_exists(reference, job, options):
+    # a package matching the job's settings and options, built from the current recipe
+    query = " AND ".join(["%s=%s" % item for item in sorted(job.settings.items())] +
+                         ["%s=%s" % item for item in options])
+    try:
+        output = subprocess.check_output('conan search {0} -q "{1}"'.format(reference, query), shell=True,
+                                         stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+    except subprocess.CalledProcessError:
+        return False
+    packages = output.split("Package_ID")[1:]
+    return any("outdated from recipe: True" not in package for package in packages)
+
+def plan_jobs(reference, jobs):
+    # Drops the jobs building the same package id as an earlier one (e.g. the msvc_platforms)
+    # and the ones whose package is already in the local cache
+    recipe = read_recipe()
+    insensitive_options = package_id_insensitive_options(recipe)
+    default_options = recipe_default_options(recipe)
+    planned = []
+    seen = set()
+    for job in jobs:
+        options = package_options(job, default_options, insensitive_options)
+        key = (tuple(sorted(job.settings.items())), tuple(options))
+        if key in seen:
+            print("[plan] same package as an earlier configuration, skipped: %s" % job.log)
+            continue
+        seen.add(key)
+        if package_exists(reference, job, options):
+            print("[plan] already in the local cache, skipped: %s" % job.log)
+            job.status = "cached"
+            continue
+        planned.append(job)
+    print("[plan] %d of %d configurations to build" % (len(planned), len(jobs)))
+    return planned
+
+def run_jobs(target_os, jobs, parallel):
+    # Runs the conan commands `parallel` at a time, each one writing to its own log.
+    # The cores are split between the running builds through CONAN_CPU_COUNT
+    # (used by tools.cpu_count() in the recipe), so the total make jobs stay ~ cores.
+    pending = list(jobs)
+    lock = threading.Lock()
+    cpus = max(1, multiprocessing.cpu_count() // parallel)
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                job = pending.pop(0)
+                print("[{os}] {cmdstr} > {log}".format(os=target_os, cmdstr=job.cmd, log=job.log))
+
+            env = dict(os.environ)
+            env.update(job.env)
+            if parallel > 1:
+                env["CONAN_CPU_COUNT"] = str(cpus)
+
+            start = time.time()
+            with open(job.log, "w") as log:
+                ret = subprocess.call(job.cmd, shell=True, stdout=log, stderr=subprocess.STDOUT, env=env)
+            job.duration = time.time() - start
+            job.status = "ok" if ret == 0 else "failed (%d)" % ret
+
+            with lock:
+                print("[{os}] {status} in {duration:.0f}s: {log}".format(os=target_os, status=job.status,
+                                                                         duration=job.duration, log=job.log))
+
+    threads = [threading.Thread(target=worker) for _ in range(min(parallel, len(jobs)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return jobs
+
+def link_component_checks(reference, jobs):
+    # test_package against a shared and a static package with link_components=uc, which only
+    # links icuuc and icudata: link_components isn't in the package id, so conan test reuses them
+    checks = []
+    for link in (True, False):
+        job = next((job for job in jobs if job.options['shared'] == link and job.status in ("ok", "cached")), None)
+        if not job:
+            continue
+        cmd = re.sub(r'^conan create \S+ -k -ne', 'conan test test_package %s' % reference, job.cmd)
+        checks.append(Job(cmd + ' -o icu:link_components=uc', job.log.replace('.log', '-link_components_uc.log'),
+                          job.settings, dict(job.options, link_components='uc'), job.env))
+    return checks
+
+def print_results(jobs):
+    if not jobs:
+        return
+    width = max([len("configuration")] + [len(job.log) for job in jobs])
+    print("")
+    print("{0:<{width}}  {1:<12}  {2:>10}".format("configuration", "status", "duration", width=width))
+    for job in jobs:
+        print("{0:<{width}}  {1:<12}  {2:>9.0f}s".format(job.log, job.status, job.duration, width=width))
+    failed = len([job for job in jobs if job.status != "ok"])
+    print("{0} configurations, {1} failed".format(len(jobs), failed))
     
-def main(target_os):
+def main(target_os, parallel, dry_run):
     name = "icu"
     version = "60.1"
     channel = "sigmoidal/testing"
@@ -28,46 +177,81 @@ def main(target_os):
     shared = [ True, False ]
     compiler_versions = [ "15", "14" ]
     msvc_platforms = [ "msys", "cygwin" ]
+    # every data packaging is published, archive (the default) first
+    data_packagings = [ "archive", "files", "shared", "static" ]
+
+    # consecutive data_packaging variants reuse the compiled ICU objects (see IcuConan.use_shared_build_tree)
+    if "CONAN_ICU_SHARED_BUILD_DIR" not in os.environ:
+        os.environ["CONAN_ICU_SHARED_BUILD_DIR"] = os.path.abspath("icu_build_trees")
 
     os.system('conan remote add sigmoidal "https://api.bintray.com/conan/sigmoidal/public-conan"')
 
+    # export once: the planner compares the packages in the cache with this recipe,
+    # and concurrent builds must not re-export the recipe under each other
+    os.system("conan export {channel} -k".format(channel=channel))
+    reference = "{name}/{version}@{channel}".format(name=name, version=version, channel=channel)
+
+    jobs = []
+    results = []
+    # every configuration, planned or not, for link_component_checks
+    configurations = []
+
     if target_os == 'win':
         for msvc_platform in msvc_platforms:
-            source_clear_cmd = "conan remove {name}/{version}@{channel} -s -f".format(name=name, version=version, channel=channel)
-            os.system( source_clear_cmd )
-
             for arch in archs:
                 for compiler_version in compiler_versions:
                     for build_type in build_types:
                         for link in shared:
-                            if shared:
-                                win_runtime = "MD" if build_type == "Release" else "MDd"
-                            else:
-                                win_runtime = "MT" if build_type == "Release" else "MTd"
+                            for data_packaging in data_packagings:
+                                if link:
+                                    win_runtime = "MD" if build_type == "Release" else "MDd"
+                                else:
+                                    win_runtime = "MT" if build_type == "Release" else "MTd"
 
-                            cmd = 'conan create {channel} -k \
-                                   -s arch={arch} \
-                                   -s build_type={build_type} \
-                                   -s compiler.version={compiler} \
-                                   -s compiler.runtime={compiler_runtime} \
-                                   -o icu:with_unit_tests=True \
-                                   -o icu:msvc_platform={msvc_platform} \
-                                   -o icu:shared={link} > {name}-{version}-{arch}-{build_type}-{link_str}-{compiler_runtime}-{msvc_platform}-{used_compiler}.log'.format(name=name,
-                                                                                                                                                                         version=version,
-                                                                                                                                                                         channel=channel,
-                                                                                                                                                                         arch=arch,
-                                                                                                                                                                         compiler=compiler_version,
-                                                                                                                                                                         compiler_runtime=win_runtime,
-                                                                                                                                                                         used_compiler="vs2017" if compiler_version == "15" else "vs2015",
-                                                                                                                                                                         build_type=build_type,
-                                                                                                                                                                         link=str(link),
-                                                                                                                                                                         link_str='shared' if link else 'static',
-                                                                                                                                                                         msvc_platform=msvc_platform)
-                            print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                            os.system( cmd )
-
-                            os.system('conan upload {name}/{version}@{channel} --all -r sigmoidal'.format(name=name, version=version, channel=channel))
+                                cmd = 'conan create {channel} -k{not_export} \
+                                       -s arch={arch} \
+                                       -s build_type={build_type} \
+                                       -s compiler.version={compiler} \
+                                       -s compiler.runtime={compiler_runtime} \
+                                       -o icu:with_unit_tests=True \
+                                       -o icu:msvc_platform={msvc_platform} \
+                                       -o icu:data_packaging={data_packaging} \
+                                       -o icu:shared={link}'.format(channel=channel,
+                                                                    arch=arch,
+                                                                    compiler=compiler_version,
+                                                                    compiler_runtime=win_runtime,
+                                                                    build_type=build_type,
+                                                                    link=str(link),
+                                                                    msvc_platform=msvc_platform,
+                                                                    data_packaging=data_packaging,
+                                                                    not_export=' -ne')
+                                log = '{name}-{version}-{arch}-{build_type}-{link_str}-{data_packaging}-{compiler_runtime}-{msvc_platform}-{used_compiler}.log'.format(
+                                    name=name, version=version, arch=arch, build_type=build_type, link_str='shared' if link else 'static',
+                                    data_packaging=data_packaging, compiler_runtime=win_runtime, msvc_platform=msvc_platform,
+                                    used_compiler="vs2017" if compiler_version == "15" else "vs2015")
+                                jobs.append(Job(cmd, log,
+                                                settings={'arch': arch, 'build_type': build_type,
+                                                          'compiler.version': compiler_version,
+                                                          'compiler.runtime': win_runtime},
+                                                options={'with_unit_tests': True, 'msvc_platform': msvc_platform,
+                                                         'data_packaging': data_packaging, 'shared': link}))
 
+        # msvc_platform doesn't change the package id, so usually only the first platform builds
+        configurations = jobs
+        planned = plan_jobs(reference, jobs)
+        jobs = []
+        for msvc_platform in msvc_platforms:
+            batch = [job for job in planned if job.options['msvc_platform'] == msvc_platform]
+            if not batch or dry_run:
+                continue
+
+            # the source folder is removed between platforms, so each one is a batch of its own
+            source_clear_cmd = "conan remove {name}/{version}@{channel} -s -f".format(name=name, version=version, channel=channel)
+            os.system( source_clear_cmd )
+
+            results.extend(run_jobs(target_os, batch, parallel))
+
+            os.system('conan upload {name}/{version}@{channel} --all -r sigmoidal'.format(name=name, version=version, channel=channel))
                             
     elif target_os == 'linux':
     
@@ -94,27 +278,37 @@ def main(target_os):
                 except subprocess.CalledProcessError as e:
                     print("ERROR: CXX Compiler \"%s\" is not installed!" % cxx)
                     continue
+
+                # the profile sets the compiler, read its settings for the package planning
+                profile = 'gcc%s' % compiler_major_version
+                try:
+                    settings = profile_settings(profile)
+                except subprocess.CalledProcessError as e:
+                    print("ERROR: conan profile \"%s\" is not defined!" % profile)
+                    continue
                             
-                os.environ['CC'] = cc
-                os.environ['CXX'] = cxx
-                        
                 for build_type in build_types:
                     for link in shared:
-                        cmd = 'conan create {channel} -k \
-                               --profile {profile} \
-                               -s arch={arch} \
-                               -s build_type={build_type} \
-                               -o icu:shared={link} 2>&1 | tee {name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}.log'.format(name=name,
-                                                                                                                                           version=version,
-                                                                                                                                           channel=channel, 
-                                                                                                                                           profile='gcc%s' % compiler_major_version,
-                                                                                                                                           arch=arch, 
-                                                                                                                                           used_compiler="gcc" + compiler_version,
-                                                                                                                                           build_type=build_type,
-                                                                                                                                           link=str(link),
-                                                                                                                                           link_str='shared' if link else 'static')
-                        print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                        os.system( cmd )
+                        for data_packaging in data_packagings:
+                            cmd = 'conan create {channel} -k{not_export} \
+                                   --profile {profile} \
+                                   -s arch={arch} \
+                                   -s build_type={build_type} \
+                                   -o icu:data_packaging={data_packaging} \
+                                   -o icu:shared={link}'.format(channel=channel,
+                                                                profile=profile,
+                                                                arch=arch,
+                                                                build_type=build_type,
+                                                                link=str(link),
+                                                                data_packaging=data_packaging,
+                                                                not_export=' -ne')
+                            log = '{name}-{version}-{arch}-{build_type}-{link_str}-{data_packaging}-{used_compiler}.log'.format(
+                                name=name, version=version, arch=arch, build_type=build_type, link_str='shared' if link else 'static',
+                                data_packaging=data_packaging, used_compiler="gcc" + compiler_version)
+                            jobs.append(Job(cmd, log,
+                                            settings=dict(settings, arch=arch, build_type=build_type),
+                                            options={'data_packaging': data_packaging, 'shared': link},
+                                            env={'CC': cc, 'CXX': cxx}))
                             
     elif target_os == 'macosx':
     
@@ -125,26 +319,40 @@ def main(target_os):
             for compiler_version in compiler_versions:
                 for build_type in build_types:
                     for link in shared:
-                        cmd = 'conan create {channel} -k \
-                               -s arch={arch} \
-                               -s build_type={build_type} \
-                               -s compiler={compiler} \
-                               -s compiler.version={compiler_v} \
-                               -o icu:shared={link} 2>&1 | tee {name}-{version}-{arch}-{build_type}-{link_str}-{used_compiler}.log'.format(name=name,
-                                                                                                                                           version=version,
-                                                                                                                                           channel=channel, 
-                                                                                                                                           arch=arch, 
-                                                                                                                                           compiler=compiler,
-                                                                                                                                           compiler_v=compiler_version,
-                                                                                                                                           used_compiler=compiler + '-' + compiler_version,
-                                                                                                                                           build_type=build_type,
-                                                                                                                                           link=str(link),
-                                                                                                                                           link_str='shared' if link else 'static')
-                        print("[{os}] {cmdstr}".format(os=target_os, cmdstr=" ".join(cmd.split())))
-                        os.system( cmd )
+                        for data_packaging in data_packagings:
+                            cmd = 'conan create {channel} -k{not_export} \
+                                   -s arch={arch} \
+                                   -s build_type={build_type} \
+                                   -s compiler={compiler} \
+                                   -s compiler.version={compiler_v} \
+                                   -o icu:data_packaging={data_packaging} \
+                                   -o icu:shared={link}'.format(channel=channel,
+                                                                arch=arch,
+                                                                compiler=compiler,
+                                                                compiler_v=compiler_version,
+                                                                build_type=build_type,
+                                                                link=str(link),
+                                                                data_packaging=data_packaging,
+                                                                not_export=' -ne')
+                            log = '{name}-{version}-{arch}-{build_type}-{link_str}-{data_packaging}-{used_compiler}.log'.format(
+                                name=name, version=version, arch=arch, build_type=build_type, link_str='shared' if link else 'static',
+                                data_packaging=data_packaging, used_compiler=compiler + '-' + compiler_version)
+                            jobs.append(Job(cmd, log,
+                                            settings={'arch': arch, 'build_type': build_type,
+                                                      'compiler': compiler, 'compiler.version': compiler_version},
+                                            options={'data_packaging': data_packaging, 'shared': link}))
     else:
         usage()
         exit(1)
+
+    if jobs:
+        configurations = jobs
+        jobs = plan_jobs(reference, jobs)
+    if dry_run:
+        return
+    results.extend(run_jobs(target_os, jobs, parallel))
+    results.extend(run_jobs(target_os, link_component_checks(reference, configurations), parallel))
+    print_results(results)
         
     os.system("conan search {name}/{version}@{channel} --table=file.html".format(name=name, version=version, channel=channel) )
 
@@ -155,8 +363,22 @@ if len(sys.argv) < 2:
 
 target_os=sys.argv[1]
 
+parallel = 1
+dry_run = False
+args = sys.argv[2:]
+while args:
+    if args[0] == '-j' and len(args) > 1 and args[1].isdigit() and int(args[1]) > 0:
+        parallel = int(args[1])
+        args = args[2:]
+    elif args[0] == '--dry-run':
+        dry_run = True
+        args = args[1:]
+    else:
+        usage()
+        exit(1)
+
 if target_os == 'win' or target_os == 'linux' or target_os == 'macosx':
-    main(target_os)
+    main(target_os, parallel, dry_run)
 else:
     usage()
     
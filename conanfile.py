@@ -3,6 +3,29 @@ import os
 import glob
 import shutil
 import re
+import platform
+import subprocess
+import fnmatch
+import hashlib
+import threading
+import time
+import uuid
+import json
+import struct
+import socket
+import multiprocessing
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+try:
+    import fcntl
+except ImportError:
+    # Windows locks files with msvcrt
+    fcntl = None
+    import msvcrt
 
 #
 # Refer to http://userguide.icu-project.org/icudata for the data_packaging option
@@ -40,20 +63,79 @@ class IcuConan(ConanFile):
     description = "ICU is a mature, widely used set of C/C++ and Java libraries providing Unicode and Globalization support for software applications."
     url = "https://github.com/sigmoidal/conan-icu"
     settings = "os", "arch", "compiler", "build_type"
+    exports_sources = "helpers/*"
     source_url = "http://download.icu-project.org/files/icu4c/{0}/icu4c-{1}-src".format(version,version.replace('.', '_'))
     data_url = "http://download.icu-project.org/files/icu4c/{0}/icu4c-{1}-data".format(version,version.replace('.', '_'))
 
+    # sha256 of the downloaded files, checked on every fetch. The ones not listed here are
+    # pinned in the download cache the first time they are fetched (see fetch_sources) and
+    # their sha256 is printed, to be added here. CONAN_ICU_REQUIRE_SHA256=1 refuses them.
+    # TODO: pin the data zip, the #13469 patch and config.guess/config.sub (at config_revision)
+    source_sha256 = { source_url + '.tgz': 'f8f5a6c8fbf32c015a467972bdb1477dc5f5d5dfea908b6ed218715eeb5ee225' }
+
+    # commit of GNU config.git the config.guess and config.sub updates are fetched at.
+    # None fetches the branch head, which moves: their sha256 can't be pinned until this
+    # is set to a fixed commit id.
+    config_revision = None
+
+
     options = {"shared": [True, False],
                "msvc_platform": ["msys", "cygwin"],
                "data_packaging": ["shared", "static", "files", "archive"],
                "with_unit_tests": [True, False],
-               "silent": [True, False]}
+               "silent": [True, False],
+               "data_locales": "ANY",
+               "data_converters": "ANY",
+               "compiler_cache": ["none", "ccache", "sccache"],
+               "with_data_loader": [True, False],
+               "with_alloc_hooks": [True, False],
+               "with_pgo": [True, False],
+               "with_tools": [True, False],
+               "with_extras": [True, False],
+               "with_samples": [True, False],
+               "with_icuio": [True, False],
+               "with_legacy_conversion": [True, False],
+               "with_collation": [True, False],
+               "with_formatting": [True, False],
+               "with_transliteration": [True, False],
+               "with_break_iteration": [True, False],
+               "with_regular_expressions": [True, False],
+               "link_components": "ANY",
+               "runtime_package": [True, False],
+               "cpu_target": ["baseline", "x86-64-v2", "x86-64-v3", "native"],
+               "optimization": ["default", "O2", "O3", "Os"],
+               "profiling": [True, False],
+               "make_jobs": "ANY",
+               "distcc_workers": "ANY"}
 
     default_options = "shared=False", \
                       "msvc_platform=msys", \
                       "data_packaging=archive", \
                       "with_unit_tests=False", \
-                      "silent=True"
+                      "silent=True", \
+                      "data_locales=all", \
+                      "data_converters=all", \
+                      "compiler_cache=none", \
+                      "with_data_loader=False", \
+                      "with_alloc_hooks=False", \
+                      "with_pgo=False", \
+                      "with_tools=True", \
+                      "with_extras=True", \
+                      "with_samples=True", \
+                      "with_icuio=True", \
+                      "with_legacy_conversion=True", \
+                      "with_collation=True", \
+                      "with_formatting=True", \
+                      "with_transliteration=True", \
+                      "with_break_iteration=True", \
+                      "with_regular_expressions=True", \
+                      "link_components=all", \
+                      "runtime_package=False", \
+                      "cpu_target=baseline", \
+                      "optimization=default", \
+                      "profiling=False", \
+                      "make_jobs=auto", \
+                      "distcc_workers=none"
     
     # Dictionary storing strings useful for setting up the configuration and make command lines
     cfg = { 'enable_debug': '', 
@@ -65,6 +147,71 @@ class IcuConan(ConanFile):
             'data_packaging': '', 
             'general_opts': '' }
 
+    # ICU data trees holding locale bundles: file list shipped by ICU and the local
+    # override file its data Makefile includes afterwards (see the comments in resfiles.mk)
+    data_locale_lists = { 'locales': ('resfiles.mk', 'reslocal.mk'),
+                          'curr': ('resfiles.mk', 'reslocal.mk'),
+                          'lang': ('resfiles.mk', 'reslocal.mk'),
+                          'region': ('resfiles.mk', 'reslocal.mk'),
+                          'unit': ('resfiles.mk', 'reslocal.mk'),
+                          'zone': ('resfiles.mk', 'reslocal.mk'),
+                          'coll': ('colfiles.mk', 'collocal.mk'),
+                          'rbnf': ('rbnffiles.mk', 'rbnflocal.mk'),
+                          'brkitr': ('brkfiles.mk', 'brklocal.mk') }
+
+    # converter tables are listed in several files, all overridden by ucmlocal.mk
+    data_converter_lists = [ 'ucmcore.mk', 'ucmfiles.mk', 'ucmebcdic.mk' ]
+
+    # ICU features which can be compiled out (see unicode/uconfig.h)
+    uconfig_features = { 'with_legacy_conversion': 'UCONFIG_NO_LEGACY_CONVERSION',
+                         'with_collation': 'UCONFIG_NO_COLLATION',
+                         'with_formatting': 'UCONFIG_NO_FORMATTING',
+                         'with_transliteration': 'UCONFIG_NO_TRANSLITERATION',
+                         'with_break_iteration': 'UCONFIG_NO_BREAK_ITERATION',
+                         'with_regular_expressions': 'UCONFIG_NO_REGULAR_EXPRESSIONS' }
+
+    # gcc/clang flags of each cpu_target. gcc 5/6 don't know -march=x86-64-v2/v3, so the
+    # features of the x86-64 psABI levels are spelled out (the tuning stays generic).
+    x86_64_v2_flags = ['-msse3', '-mssse3', '-msse4.1', '-msse4.2', '-mpopcnt', '-mcx16', '-msahf']
+    cpu_target_flags = { 'baseline': [],
+                         'x86-64-v2': x86_64_v2_flags,
+                         'x86-64-v3': x86_64_v2_flags + ['-mavx', '-mavx2', '-mbmi', '-mbmi2', '-mf16c', '-mfma',
+                                                         '-mlzcnt', '-mmovbe', '-mxsave'],
+                         'native': ['-march=native'] }
+
+    # ICU libraries in link order (each one only uses the ones after it) and what they need.
+    # tu and test are the tools' libraries, consumers only get them when asked for.
+    library_components = [ ('test', ['tu', 'i18n', 'uc', 'data']),
+                           ('tu', ['i18n', 'uc', 'data']),
+                           ('io', ['i18n', 'uc', 'data']),
+                           ('i18n', ['uc', 'data']),
+                           ('uc', ['data']),
+                           ('data', []) ]
+
+    # ICU test programs and the make variable passing arguments to each of them
+    unit_test_suites = [('cintltst', 'CINTLTST_OPTS'), ('intltest', 'INTLTEST_OPTS'), ('iotest', 'IOTEST_OPTS')]
+
+    def configure(self):
+        if self.settings.os == 'Windows' and self.options.compiler_cache == 'ccache':
+            raise Exception("ccache cannot wrap the MSVC compiler, use compiler_cache=sccache on Windows.")
+        if self.settings.os == 'Windows' and self.options.with_pgo:
+            raise Exception("with_pgo is only supported by the gcc/clang builds (build_unix).")
+        if self.options.cpu_target != 'baseline':
+            if self.settings.arch != 'x86_64':
+                raise Exception("cpu_target=%s requires arch=x86_64." % self.options.cpu_target)
+            if self.settings.os == 'Windows' and self.options.cpu_target != 'x86-64-v3':
+                raise Exception("MSVC only supports cpu_target=baseline or x86-64-v3 (/arch:AVX2).")
+        if str(self.options.make_jobs) != 'auto' and \
+           (not str(self.options.make_jobs).isdigit() or int(str(self.options.make_jobs)) < 1):
+            raise Exception("make_jobs must be 'auto' or a positive number of jobs, not '%s'." % self.options.make_jobs)
+        if self.options.distcc_workers != 'none':
+            if self.settings.os == 'Windows':
+                raise Exception("distcc_workers is only supported by the gcc/clang builds (build_unix).")
+            if self.options.compiler_cache == 'sccache':
+                raise Exception("distcc_workers can't be combined with compiler_cache=sccache, use ccache.")
+            if self.options.with_pgo:
+                raise Exception("distcc_workers can't be combined with with_pgo, the workers don't see the profile.")
+
     def build_requirements(self):
         if self.settings.os == "Windows":
             # conan remote add bincrafters "https://api.bintray.com/conan/bincrafters/public-conan"
@@ -75,30 +222,50 @@ class IcuConan(ConanFile):
                 self.build_requires("msys2_installer/latest@bincrafters/testing")
 
     def source(self):
-        self.output.info("Fetching sources: {0}.tgz".format(self.source_url))
-        
-        tools.get("{0}.tgz".format(self.source_url))
-        
         src_folder = os.getcwd()
+        source_file = "{0}.tgz".format(self.source_url)
+        data_file = "{0}.zip".format(self.data_url)
+        patchfile = 'icu-60.1-msvc-escapesrc.patch'
 
         # update the outdated config.guess and config.sub included in ICU
         # ICU Ticket: http://bugs.icu-project.org/trac/ticket/13470
         config_updates = [ 'config.guess', 'config.sub' ]
+        config_url = 'http://git.savannah.gnu.org/gitweb/?p=config.git;a=blob_plain;f={0};hb=%s' % (self.config_revision or 'HEAD')
+        if not self.config_revision:
+            self.output.warn('config_revision is not set, fetching config.guess and config.sub from the config.git head')
+
+        downloads = [ (source_file, os.path.basename(source_file)),
+                      (data_file, os.path.basename(data_file)),
+                      ('http://bugs.icu-project.org/trac/raw-attachment/ticket/13469/%s' % patchfile, patchfile) ]
+        downloads.extend((config_url.format(cfg_update), cfg_update) for cfg_update in config_updates)
+
+        self.phase_timings = []
+        with self.timed_phase('source_fetch'):
+            digests = self.fetch_sources(downloads)
+        self.write_phase_timings(os.path.join(src_folder, 'source_timings.json'))
+        # what was actually fetched, part of the shared build tree keys (see recipe_key)
+        with open(os.path.join(src_folder, 'source_digests.json'), 'w') as f:
+            json.dump(digests, f, indent=2, sort_keys=True)
+
+        self.output.info("Extracting sources: {0}".format(os.path.basename(source_file)))
+        tools.unzip(os.path.basename(source_file))
+        os.unlink(os.path.basename(source_file))
+
         for cfg_update in config_updates:
             dst_config = os.path.join(src_folder, self.name, 'source', cfg_update)
             if os.path.isfile(dst_config):
                 os.remove(dst_config)
             self.output.info('Updating %s' % dst_config)
-            tools.download('http://git.savannah.gnu.org/gitweb/?p=config.git;a=blob_plain;f={0};hb=HEAD'.format(cfg_update), dst_config)
+            shutil.move(cfg_update, dst_config)
         
         #
         # ICU has incomplete data in the tgz file released,
         # need to download and merge them separately.
         # http://bugs.icu-project.org/trac/ticket/13139
         #
-        data_web_file = "{0}.zip".format(self.data_url)
-        self.output.info('Fetching data: %s' % data_web_file)
-        tools.get(data_web_file)
+        self.output.info('Extracting data: %s' % os.path.basename(data_file))
+        tools.unzip(os.path.basename(data_file))
+        os.unlink(os.path.basename(data_file))
 
         icu_datadir = os.path.join(src_folder, self.name, 'source', 'data')
         downloaded_icu_datadir = os.path.join(src_folder,'data')
@@ -106,13 +273,135 @@ class IcuConan(ConanFile):
         shutil.rmtree(icu_datadir)
         os.rename(downloaded_icu_datadir, icu_datadir)
 
-        # Download and apply patch for ICU Ticket: http://bugs.icu-project.org/trac/ticket/13469
-        patchfile = 'icu-60.1-msvc-escapesrc.patch'
-        tools.download('http://bugs.icu-project.org/trac/raw-attachment/ticket/13469/%s' % patchfile, patchfile)
+        # Apply patch for ICU Ticket: http://bugs.icu-project.org/trac/ticket/13469
         tools.patch(base_path=os.path.join(src_folder, self.name), patch_file=patchfile, strip=1)
 
+    def file_sha256(self, path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def fetch_sources(self, downloads):
+        # downloads: list of (url, filename) pairs fetched into the current folder.
+        #
+        # With CONAN_ICU_DOWNLOAD_CACHE pointing to a folder, files are kept there
+        # by sha256 (blobs/<sha256>) with an index per url (urls/<sha256 of url>).
+        # Known hashes are pinned in source_sha256, the others are pinned the first
+        # time they are fetched. Cached blobs are verified on every hit.
+        # CONAN_ICU_OFFLINE=1 never touches the network and fails on a cache miss.
+        # CONAN_ICU_REQUIRE_SHA256=1 fails on any download not pinned in source_sha256.
+        cache_dir = os.environ.get('CONAN_ICU_DOWNLOAD_CACHE')
+        offline = os.environ.get('CONAN_ICU_OFFLINE', '').lower() in ('1', 'true', 'yes', 'on')
+        require_sha256 = os.environ.get('CONAN_ICU_REQUIRE_SHA256', '').lower() in ('1', 'true', 'yes', 'on')
+
+        if require_sha256:
+            unpinned = [url for url, _ in downloads if url not in self.source_sha256]
+            if unpinned:
+                raise Exception("CONAN_ICU_REQUIRE_SHA256 is set and these downloads are not pinned in "
+                                "source_sha256: %s" % ", ".join(unpinned))
+
+        if offline and not cache_dir:
+            raise Exception("CONAN_ICU_OFFLINE requires CONAN_ICU_DOWNLOAD_CACHE to be set.")
+
+        if cache_dir:
+            for subdir in ('blobs', 'urls', 'tmp'):
+                if not os.path.isdir(os.path.join(cache_dir, subdir)):
+                    try:
+                        os.makedirs(os.path.join(cache_dir, subdir))
+                    except OSError:
+                        # another build created it meanwhile
+                        if not os.path.isdir(os.path.join(cache_dir, subdir)):
+                            raise
+
+        def url_index(url):
+            return os.path.join(cache_dir, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+        def cached_blob(url):
+            index = url_index(url)
+            if not os.path.isfile(index):
+                return None
+            with open(index) as f:
+                sha256 = f.read().strip()
+            expected = self.source_sha256.get(url)
+            if expected and expected != sha256:
+                self.output.warn('Cached %s does not match the pinned sha256, discarding it' % url)
+                return None
+            blob = os.path.join(cache_dir, 'blobs', sha256)
+            if not os.path.isfile(blob):
+                return None
+            if self.file_sha256(blob) != sha256:
+                self.output.warn('Cached %s is corrupted, discarding it' % url)
+                os.remove(blob)
+                return None
+            return blob
+
+        # filename -> sha256 of what was fetched, returned for source_digests.json
+        digests = {}
+
+        misses = []
+        for url, filename in downloads:
+            blob = cached_blob(url) if cache_dir else None
+            if blob:
+                self.output.info('Using cached %s' % url)
+                shutil.copyfile(blob, filename)
+                digests[filename] = os.path.basename(blob)
+            elif offline:
+                raise Exception("Offline mode: %s is not in the download cache %s" % (url, cache_dir))
+            else:
+                misses.append((url, filename))
+
+        errors = []
+
+        def fetch(url, filename):
+            try:
+                tmp_file = os.path.join(cache_dir, 'tmp', '%s.%d' % (uuid.uuid4().hex, os.getpid())) if cache_dir \
+                           else filename + '.part'
+                self.output.info('Fetching %s' % url)
+                tools.download(url, tmp_file, out=self.output, overwrite=True)
+                sha256 = self.file_sha256(tmp_file)
+                expected = self.source_sha256.get(url)
+                if expected and expected != sha256:
+                    os.remove(tmp_file)
+                    raise Exception("sha256 mismatch for %s: expected %s, got %s" % (url, expected, sha256))
+                if not expected:
+                    self.output.warn("%s is not pinned in source_sha256 (sha256 %s)" % (url, sha256))
+                digests[filename] = sha256
+                if cache_dir:
+                    blob = os.path.join(cache_dir, 'blobs', sha256)
+                    # renames are atomic, concurrent builds fetching the same file are fine
+                    if os.path.isfile(blob):
+                        os.remove(tmp_file)
+                    else:
+                        os.rename(tmp_file, blob)
+                    index_tmp = '%s.%s' % (url_index(url), uuid.uuid4().hex)
+                    with open(index_tmp, 'w') as f:
+                        f.write(sha256)
+                    if os.path.isfile(url_index(url)):
+                        os.remove(url_index(url))
+                    os.rename(index_tmp, url_index(url))
+                    shutil.copyfile(blob, filename)
+                else:
+                    shutil.move(tmp_file, filename)
+            except Exception as e:
+                errors.append("%s: %s" % (url, e))
+
+        # the downloads are independent, fetch the missing ones in parallel
+        threads = [threading.Thread(target=fetch, args=miss) for miss in misses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise Exception("Failed to fetch sources:\n%s" % "\n".join(errors))
+
+        return digests
+
     def build(self):
         root_path = self.conanfile_directory
+        self.phase_timings = []
 
         if self.settings.os == 'Windows':
             runtime = str(self.settings.compiler.runtime)
@@ -130,9 +419,40 @@ class IcuConan(ConanFile):
             tools.replace_in_file(runConfigureICU_file, '        CC=gcc; export CC\n', '', strict=True)
             tools.replace_in_file(runConfigureICU_file, '        CXX=g++; export CXX\n', '', strict=True)
 
+        if self.options.optimization != 'default':
+            self.set_release_optimization(runConfigureICU_file)
+
+        if self.options.compiler_cache != 'none':
+            self.setup_compiler_cache(runConfigureICU_file, root_path)
+
         self.cfg['icu_source_dir'] = os.path.join(root_path, self.name, 'source')
         self.cfg['build_dir'] = os.path.join(root_path, self.name, 'build')
         self.cfg['output_dir'] = os.path.join(root_path, 'output')
+        self.cfg['host_tools_dir'] = None
+
+        shared_build_lock = None
+        if os.environ.get('CONAN_ICU_SHARED_BUILD_DIR'):
+            shared_build_lock = self.use_shared_build_tree(os.environ['CONAN_ICU_SHARED_BUILD_DIR'])
+
+        self.subset_data(os.path.join(self.cfg['icu_source_dir'], 'data'))
+
+        # an archive restored into data/in/ by an earlier build of a shared build tree would shadow the sources
+        data_archive = os.path.join(self.cfg['icu_source_dir'], 'data', 'in', '%s.dat' % self.data_platform_name())
+        if os.path.isfile(data_archive):
+            os.remove(data_archive)
+        data_cache_entry = None
+        if os.environ.get('CONAN_ICU_DATA_CACHE'):
+            with self.timed_phase('data_cache_restore'):
+                data_cache_entry = self.data_cache_entry(os.environ['CONAN_ICU_DATA_CACHE'])
+                if os.path.isfile(data_cache_entry):
+                    # the data Makefile then unpacks it with icupkg instead of compiling the sources
+                    # with genrb, makeconv, gennorm2... (as when building from the release tarball)
+                    self.output.info("Using the compiled ICU data from %s" % data_cache_entry)
+                    shutil.copyfile(data_cache_entry, data_archive)
+                # an archive left in data/out/ by an earlier data_packaging=archive build of a shared
+                # build tree (maybe with other data_locales) must not be cached as this build's
+                for stale_archive in glob.glob(os.path.join(self.cfg['build_dir'], 'data', 'out', '*.dat')):
+                    os.remove(stale_archive)
 
         self.cfg['silent'] = '--silent' if self.options.silent else 'VERBOSE=1'
         self.cfg['enable_debug'] = '--enable-debug --disable-release' if self.settings.build_type == 'Debug' else ''
@@ -140,48 +460,345 @@ class IcuConan(ConanFile):
         self.cfg['enable_static'] = '--enable-static --disable-shared' if not self.options.shared else '--enable-shared --disable-static'
         self.cfg['data_packaging'] = '--with-data-packaging={0}'.format(self.options.data_packaging) 
         self.cfg['general_opts'] = '--disable-layout --disable-layoutex'
+
+        # The tools are always built since the data build needs them, with_tools only decides
+        # whether they get packaged. The test suites are only needed for with_unit_tests.
+        if not self.options.with_extras:
+            self.cfg['general_opts'] += ' --disable-extras'
+        if not self.options.with_samples:
+            self.cfg['general_opts'] += ' --disable-samples'
+        if not self.options.with_icuio:
+            self.cfg['general_opts'] += ' --disable-icuio'
+        if not self.options.with_unit_tests:
+            self.cfg['general_opts'] += ' --disable-tests'
                 
         if not self.options.shared:
             self.cpp_info.defines.append("U_STATIC_IMPLEMENTATION")
 
-        if self.settings.os == 'Windows':
-            # this overrides pre-configured environments (such as Appveyor's)
-            if "VisualStudioVersion" in os.environ:
-                del os.environ["VisualStudioVersion"]
-            self.cfg['vccmd'] = tools.vcvars_command(self.settings)
+        # extra preprocessor defines and compiler flags, applied by each build path
+        self.cfg['defines'] = self.uconfig_defines()
+        self.cfg['flags'] = []
+        if not self.options.shared:
+            # lets consumers drop the unused parts of the static libraries (--gc-sections, -dead_strip, /OPT:REF)
+            self.cfg['flags'].extend(['-Gy', '-Gw'] if self.settings.os == 'Windows' else ['-ffunction-sections', '-fdata-sections'])
+        self.cfg['flags'].extend(self.cpu_flags())
+        if self.options.profiling:
+            self.cfg['flags'].extend(self.profiling_flags())
 
-            if self.options.msvc_platform == 'cygwin':
-                self.build_cygwin()
-            elif self.options.msvc_platform == 'msys':
-                self.build_msys()
-        else:
-            self.build_unix()
+        try:
+            if self.settings.os == 'Windows':
+                # this overrides pre-configured environments (such as Appveyor's)
+                if "VisualStudioVersion" in os.environ:
+                    del os.environ["VisualStudioVersion"]
+                self.cfg['vccmd'] = tools.vcvars_command(self.settings)
+
+                # runConfigureICU appends its own flags to the ones in the environment
+                for var, values in (('CPPFLAGS', ['-D%s' % define for define in self.cfg['defines']]),
+                                    ('CFLAGS', self.cfg['flags']),
+                                    ('CXXFLAGS', self.cfg['flags'])):
+                    if values:
+                        os.environ[var] = ' '.join([os.environ.get(var, '')] + values).strip()
+
+                if self.options.msvc_platform == 'cygwin':
+                    self.build_cygwin()
+                elif self.options.msvc_platform == 'msys':
+                    self.build_msys()
+            else:
+                self.build_unix()
+
+            if data_cache_entry and not os.path.isfile(data_archive):
+                with self.timed_phase('data_cache_store'):
+                    self.store_cached_data(data_cache_entry)
+        finally:
+            if shared_build_lock:
+                self.unlock_tree(shared_build_lock)
+            self.write_phase_timings(os.path.join(root_path, 'build_timings.json'))
 
     def package(self):
+        self.phase_timings = []
+        for timings_file in ('source_timings.json', 'build_timings.json'):
+            if os.path.isfile(timings_file):
+                with open(timings_file) as f:
+                    self.phase_timings.extend(json.load(f)['phases'])
+
+        with self.timed_phase('package_copy'):
+            self.package_files()
+
+        if self.options.runtime_package:
+            with self.timed_phase('package_strip'):
+                self.strip_package()
+
+        with self.timed_phase('package_footprint'):
+            self.write_footprint_report(os.path.join(self.package_folder, 'footprint.json'))
+
+        self.write_phase_timings(os.path.join(self.package_folder, 'build_timings.json'))
+
+    def write_footprint_report(self, report_file):
+        # Size of every packaged file, the data archive by category and the exported symbol
+        # counts of the libraries. CONAN_ICU_FOOTPRINT_BASELINE can point to the footprint.json
+        # of another package to include (and print) the differences.
+        files = {}
+        data = {}
+        for root, _, names in os.walk(self.package_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, self.package_folder).replace('\\', '/')
+                if os.path.islink(path) or relpath in ('footprint.json', 'build_timings.json', 'conaninfo.txt', 'conanmanifest.txt'):
+                    continue
+                entry = { 'size': os.path.getsize(path), 'kind': self.footprint_kind(relpath) }
+                if entry['kind'] == 'library':
+                    entry['exported_symbols'] = self.exported_symbol_count(path)
+                elif entry['kind'] == 'data':
+                    if name.endswith('.dat'):
+                        for item, size in self.data_archive_items(path):
+                            category = self.data_category(item)
+                            data[category] = data.get(category, 0) + size
+                    else:
+                        # data_packaging=files
+                        category = self.data_category(relpath)
+                        data[category] = data.get(category, 0) + entry['size']
+                files[relpath] = entry
+
+        totals = {}
+        for entry in files.values():
+            totals[entry['kind']] = totals.get(entry['kind'], 0) + entry['size']
+        report = { 'name': self.name,
+                   'version': self.version,
+                   'settings': dict((name, str(value)) for name, value in self.settings.values_list),
+                   'options': dict((name, str(value)) for name, value in self.options.values.as_list()),
+                   'total': sum(totals.values()),
+                   'totals': totals,
+                   'data_categories': data,
+                   'files': files }
+
+        baseline_file = os.environ.get('CONAN_ICU_FOOTPRINT_BASELINE')
+        if baseline_file:
+            with open(baseline_file) as f:
+                baseline = json.load(f)
+            report['baseline'] = baseline_file
+            report['diff'] = self.footprint_diff(baseline, report)
+
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+        self.output.info("Package footprint: %d bytes (%s)" % (report['total'], ', '.join('%s %d' % item for item in sorted(totals.items()))))
+        if data:
+            self.output.info("Data by category: %s" % ', '.join('%s %d' % item for item in sorted(data.items(), key=lambda item: -item[1])))
+        if 'diff' in report:
+            self.output.info("Footprint changes against %s:" % baseline_file)
+            for section in ('totals', 'data_categories', 'files'):
+                for key, change in sorted(report['diff'][section].items()):
+                    self.output.info("  %-10s %-40s %+d bytes" % (section, key, change))
+
+    @staticmethod
+    def footprint_diff(baseline, report):
+        # size changes of the totals, data categories and files present in either report
+        diff = {}
+        for section in ('totals', 'data_categories', 'files'):
+            old, new = baseline.get(section, {}), report[section]
+            size = lambda value: value['size'] if isinstance(value, dict) else value
+            changes = {}
+            for key in set(old) | set(new):
+                change = size(new.get(key, 0)) - size(old.get(key, 0))
+                if change:
+                    changes[key] = change
+            diff[section] = changes
+        diff['total'] = report['total'] - baseline.get('total', 0)
+        return diff
+
+    def footprint_kind(self, relpath):
+        parts = relpath.split('/')
+        if parts[0] == 'include':
+            return 'header'
+        if parts[0] == 'share' and len(parts) > 3 and parts[1] == self.name:
+            # share/icu/<version>/icudt60l.dat or share/icu/<version>/icudt60l/...
+            return 'data' if parts[3].startswith('icudt') else 'other'
+        if re.search(r'\.(so(\.[\d.]+)?|dylib|a|lib|dll)$', parts[-1]):
+            return 'library'
+        if parts[0].startswith('bin'):
+            return 'tool'
+        return 'other'
+
+    def exported_symbol_count(self, path):
+        # defined global symbols, as seen by `nm`; None where nm isn't available (MSVC)
+        if self.settings.os == 'Windows' or not tools.which('nm'):
+            return None
+        if self.settings.os == 'Macos':
+            command = ['nm', '-gU', path]
+        elif re.search(r'\.a$', path):
+            command = ['nm', '-g', '--defined-only', path]
+        else:
+            command = ['nm', '-D', '--defined-only', path]
+        try:
+            output = subprocess.check_output(command, stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        return len([line for line in output.splitlines() if re.match(r'^[0-9a-fA-F]*\s+[A-Z]\s+\S', line)])
+
+    @staticmethod
+    def data_archive_items(path):
+        # Reads the table of contents of an ICU common data archive (icudt<version><l|b>.dat):
+        # header size (uint16), magic (0xda 0x27), UDataInfo (isBigEndian at offset 8), then
+        # at the header size a uint32 count and count pairs of (name offset, data offset)
+        # relative to the table of contents.
+        with open(path, 'rb') as f:
+            blob = f.read()
+        if len(blob) < 16 or blob[2:4] != b'\xda\x27':
+            return []
+        endian = '>' if struct.unpack('B', blob[8:9])[0] else '<'
+        header_size = struct.unpack(endian + 'H', blob[0:2])[0]
+        count = struct.unpack(endian + 'I', blob[header_size:header_size + 4])[0]
+        entries = [struct.unpack(endian + 'II', blob[header_size + 4 + 8 * i:header_size + 12 + 8 * i]) for i in range(count)]
+        items = []
+        for index, (name_offset, data_offset) in enumerate(entries):
+            name_start = header_size + name_offset
+            name = blob[name_start:blob.index(b'\0', name_start)].decode('ascii', 'replace')
+            end = header_size + entries[index + 1][1] if index + 1 < count else len(blob)
+            items.append((name, end - (header_size + data_offset)))
+        return items
+
+    @staticmethod
+    def data_category(item):
+        # icudt60l/coll/de.res -> coll, icudt60l/de.res -> locales, icudt60l/ibm-5348_P100-1997.cnv -> converters
+        parts = item.replace('\\', '/').split('/')
+        for part in parts[:-1]:
+            if part in ('brkitr', 'coll', 'curr', 'lang', 'rbnf', 'region', 'translit', 'unit', 'zone'):
+                return part
+        extension = os.path.splitext(parts[-1])[1]
+        return { '.res': 'locales', '.cnv': 'converters', '.nrm': 'normalization',
+                 '.icu': 'properties', '.spp': 'stringprep' }.get(extension, 'misc')
+
+    def package_files(self):
         bin_dir_src, include_dir_src, lib_dir_src, share_dir_src = (os.path.join('output', path) for path in
                                                                     ('bin', 'include', 'lib', 'share'))
         if self.settings.os == 'Windows':
             bin_dir_dst, lib_dir_dst = ('bin64', 'lib64') if self.settings.arch == 'x86_64' else ('bin', 'lib')
 
-            # we copy everything for a full ICU package
-            self.copy("*", dst=bin_dir_dst, src=bin_dir_src, keep_path=True, symlinks=True)
-            self.copy(pattern='*.dll', dst=bin_dir_dst, src=lib_dir_src, keep_path=False)
-            self.copy("*", dst=lib_dir_dst, src=lib_dir_src, keep_path=True, symlinks=True)
+            # we package everything for a full ICU package (only the DLLs from bin/ without the tools),
+            # the DLLs go to bin/ as in upstream releases
+            with_tools = self.options.with_tools and not self.options.runtime_package
+            self.link_files("*" if with_tools else "*.dll", dst=bin_dir_dst, src=bin_dir_src)
+            self.link_files("*.dll", dst=bin_dir_dst, src=lib_dir_src, keep_path=False)
+            self.link_files("*", dst=lib_dir_dst, src=lib_dir_src, excludes=("*.dll",))
+            self.link_files("*", dst="include", src=include_dir_src)
+            self.link_files("*", dst="share", src=share_dir_src)
+        else:
+            # we package everything for a full ICU package
+            if self.options.with_tools and not self.options.runtime_package:
+                self.link_files("*", dst="bin", src=bin_dir_src)
+            self.link_files("*", dst="include", src=include_dir_src)
+            self.link_files("*", dst="lib", src=lib_dir_src)
+            self.link_files("*", dst="share", src=share_dir_src)
+
+        if self.options.with_data_loader:
+            self.copy("icu_data_loader.h", dst="include", src="helpers", keep_path=False)
 
-            # lets remove .dlls from the lib dir, they are in bin/ in upstream releases.
-            if os.path.exists(os.path.join(self.package_folder, lib_dir_dst)):
-                for item in os.listdir(os.path.join(self.package_folder, lib_dir_dst)):
-                    if item.endswith(".dll"):
-                        os.remove(os.path.join(self.package_folder, lib_dir_dst, item))
+        if self.options.with_alloc_hooks:
+            self.copy("icu_alloc_hooks.h", dst="include", src="helpers", keep_path=False)
 
-            self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
-        else:
-            # we copy everything for a full ICU package
-            self.copy("*", dst="bin", src=bin_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="include", src=include_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="lib", src=lib_dir_src, keep_path=True, symlinks=True)
-            self.copy("*", dst="share", src=share_dir_src, keep_path=True, symlinks=True)
+    def link_files(self, pattern, dst, src, keep_path=True, excludes=()):
+        # Like self.copy(), but hard links what make install wrote to output/ into the package, so
+        # large Debug libraries and data archives are written once. Falls back to copying across
+        # file systems (or without os.link, i.e. Python 2 on Windows). Symlinks are recreated.
+        # make install replaces the files it writes, but strip and objcopy rewrite files with more
+        # than one link in place, so strip_package() copies what it modifies first (unlink_file).
+        linked = []
+        src_dir = os.path.join(os.getcwd(), src)
+        for root, _, names in os.walk(src_dir):
+            for name in names:
+                if not fnmatch.fnmatch(name, pattern) or any(fnmatch.fnmatch(name, exclude) for exclude in excludes):
+                    continue
+                path = os.path.join(root, name)
+                target = os.path.join(self.package_folder, dst, os.path.relpath(path, src_dir) if keep_path else name)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                if os.path.lexists(target):
+                    os.remove(target)
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), target)
+                else:
+                    try:
+                        os.link(path, target)
+                    except (AttributeError, OSError):
+                        shutil.copy2(path, target)
+                linked.append(target)
+        return linked
+
+    @staticmethod
+    def unlink_file(path):
+        # replaces a hard linked file (see link_files) by a copy of its own
+        if os.stat(path).st_nlink > 1:
+            tmp_file = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+            shutil.copy2(path, tmp_file)
+            os.remove(path)
+            os.rename(tmp_file, path)
+
+    def strip_package(self):
+        # runtime_package=True: drops what only ICU's tools use, strips the libraries and keeps
+        # their debug info in <CONAN_ICU_DEBUG_SYMBOLS_DIR>/<name>-<version>/<package id>/
+        # (default: debug-symbols/ in the build folder), linked back with a .gnu_debuglink
+        # section on Linux and as .dSYM bundles on Macos. Windows .pdb files are moved there.
+        symbols_dir = os.path.join(os.environ.get('CONAN_ICU_DEBUG_SYMBOLS_DIR', os.path.join(self.conanfile_directory, 'debug-symbols')),
+                                   '%s-%s' % (self.name, self.version), os.path.basename(self.package_folder))
+        if os.path.isdir(symbols_dir):
+            shutil.rmtree(symbols_dir)
+
+        lib_dir = 'lib64' if self.settings.os == 'Windows' and self.settings.arch == 'x86_64' else 'lib'
+        share_dir = os.path.join(self.package_folder, 'share', self.name, self.version)
+        for unneeded in (os.path.join(self.package_folder, lib_dir, self.name),  # pkgdata's Makefile fragments
+                         os.path.join(self.package_folder, 'share', 'man'),
+                         os.path.join(share_dir, 'config'),
+                         os.path.join(share_dir, 'install-sh'),
+                         os.path.join(share_dir, 'mkinstalldirs')):
+            if os.path.isdir(unneeded):
+                shutil.rmtree(unneeded)
+            elif os.path.isfile(unneeded):
+                os.remove(unneeded)
+
+        for root, _, files in os.walk(self.package_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    continue
+                debug_file = os.path.join(symbols_dir, os.path.relpath(path, self.package_folder))
+                if self.settings.os == 'Windows':
+                    if name.endswith('.pdb'):
+                        if not os.path.isdir(os.path.dirname(debug_file)):
+                            os.makedirs(os.path.dirname(debug_file))
+                        shutil.move(path, debug_file)
+                    continue
+                shared_library = re.search(r'\.(so(\.[\d.]+)?|dylib)$', name)
+                if not shared_library and not name.endswith('.a'):
+                    continue
+                if not os.path.isdir(os.path.dirname(debug_file)):
+                    os.makedirs(os.path.dirname(debug_file))
+                # keeps the build folder's libraries unstripped, conan package can run again
+                self.unlink_file(path)
+
+                if self.settings.os == 'Macos':
+                    if shared_library:
+                        self.run('dsymutil "%s" -o "%s.dSYM"' % (path, debug_file))
+                        self.run('strip %s "%s"' % ('-S' if self.options.profiling else '-x', path))
+                    else:
+                        shutil.copy2(path, debug_file)
+                        self.run('strip -S "%s"' % path)
+                else:
+                    objcopy = os.environ.get('OBJCOPY', 'objcopy')
+                    strip = os.environ.get('STRIP', 'strip')
+                    self.run('%s --only-keep-debug "%s" "%s.debug"' % (objcopy, path, debug_file))
+                    if shared_library and self.options.profiling:
+                        # profilers need the symbol table to name the functions with no dynamic symbol
+                        self.run('%s --strip-debug "%s"' % (strip, path))
+                        self.run('%s --add-gnu-debuglink="%s.debug" "%s"' % (objcopy, debug_file, path))
+                    elif shared_library:
+                        self.run('%s --strip-unneeded "%s"' % (strip, path))
+                        self.run('%s --add-gnu-debuglink="%s.debug" "%s"' % (objcopy, debug_file, path))
+                    else:
+                        # static libraries keep their symbol tables, the consumer's link needs them
+                        self.run('%s --strip-debug "%s"' % (strip, path))
+
+        if os.path.isdir(symbols_dir):
+            self.output.info("Debug symbols kept in %s" % symbols_dir)
 
     def package_id(self):
         # Whether we built with Cygwin or MSYS shouldn't affect the package id
@@ -193,36 +810,90 @@ class IcuConan(ConanFile):
 
         # Verbosity doesn't affect package's ID
         self.info.options.silent = "any"
+
+        # Samples are never installed
+        self.info.options.with_samples = "any"
+
+        # The compiler cache only changes how fast the objects are built
+        self.info.options.compiler_cache = "any"
+
+        # Which libraries consumers link doesn't change the binaries
+        self.info.options.link_components = "any"
+
+        # Neither does the number of parallel make jobs
+        self.info.options.make_jobs = "any"
+
+        # The workers compile with the same compiler and flags, so where it happens doesn't matter
+        self.info.options.distcc_workers = "any"
+
+        # The order in which locales or converters are listed doesn't change the data
+        for subset_option in ('data_locales', 'data_converters'):
+            subset = self.data_subset(subset_option)
+            if subset is not None:
+                setattr(self.info.options, subset_option, ','.join(sorted(set(subset))) or 'none')
             
     def package_info(self):
         bin_dir, lib_dir = ('bin64', 'lib64') if self.settings.arch == 'x86_64' and self.settings.os == 'Windows' else ('bin' , 'lib')
         
         self.cpp_info.libdirs = [ lib_dir ]
         
-        self.cpp_info.libs = []
+        # library file name per component, e.g. icuuc, icuin/icuind/sicuin on Windows
         vtag = self.version.split('.')[0]
-        keep = False
+        component_libs = {}
         for lib in tools.collect_libs(self, lib_dir):
-            if not vtag in lib:
-                if lib != 'icudata':
-                    self.cpp_info.libs.append(lib)
-                else:
-                    keep = True
+            match = re.match(r'^s?icu(uc|i18n|in|io|data|dt|tu|test)d?$', lib)
+            if match and not vtag in lib:
+                component = { 'in': 'i18n', 'dt': 'data' }.get(match.group(1), match.group(1))
+                component_libs[component] = lib
+
+        # every component with its dependencies, in link order (icudata last, or it fails
+        # to link on some platforms)
+        link_order = [component for component, _ in self.library_components]
+        dependencies = dict(self.library_components)
+        def closure(components):
+            needed = set()
+            for component in components:
+                needed.add(component)
+                needed.update(dependencies[component])
+            return [component_libs[c] for c in link_order if c in needed and c in component_libs]
 
-        # if icudata is not last, it fails to build on some platforms (Windows)
-        # (have to double-check this)
-        if keep:
-            self.cpp_info.libs.append('icudata')
+        for component in link_order:
+            setattr(self.user_info, 'libs_%s' % component, ' '.join(closure([component])))
+
+        requested = str(self.options.link_components).strip()
+        if requested == 'all':
+            # everything but the tools' libraries
+            requested_components = ['io', 'i18n', 'uc', 'data']
+        else:
+            requested_components = [c.strip() for c in requested.split(',') if c.strip()]
+            unknown = [c for c in requested_components if c not in dependencies]
+            if unknown:
+                raise Exception("Unknown ICU link_components %s, use %s" % (', '.join(unknown), ', '.join(link_order)))
+        self.cpp_info.libs = closure(requested_components)
 
         self.env_info.PATH.append(os.path.join(self.package_folder, bin_dir))
 
+        # archive (icudt60l.dat) and files (icudt60l/) data are looked up in ICU_DATA at runtime
+        if self.options.data_packaging in ('archive', 'files'):
+            data_dir = os.path.join(self.package_folder, 'share', self.name, self.version)
+            self.env_info.ICU_DATA = data_dir
+            self.cpp_info.defines.append('CONAN_ICU_DATA_DIR="%s"' % data_dir.replace('\\', '/'))
+
+        self.user_info.data_packaging = str(self.options.data_packaging)
+        self.user_info.profiling = str(self.options.profiling)
+
+        # consumers must see the same uconfig.h switches as the binaries
+        self.cpp_info.defines.extend(self.uconfig_defines())
+
         if not self.options.shared:
             self.cpp_info.defines.append("U_STATIC_IMPLEMENTATION")
-            if self.settings.os == 'Linux':
-                self.cpp_info.libs.append('dl')
-                
-            if self.settings.os == 'Windows':
-                self.cpp_info.libs.append('advapi32')
+            # only icuuc uses them (plugin loading and the Windows registry for time zones)
+            if component_libs.get('uc') in self.cpp_info.libs:
+                if self.settings.os == 'Linux':
+                    self.cpp_info.libs.append('dl')
+
+                if self.settings.os == 'Windows':
+                    self.cpp_info.libs.append('advapi32')
                 
         if self.settings.compiler == "gcc":
             self.cpp_info.cppflags = ["-std=c++11"]
@@ -254,6 +925,713 @@ class IcuConan(ConanFile):
 
         return config_cmd
 
+    def setup_compiler_cache(self, runConfigureICU_file, root_path):
+        # The cache folder and size come from CONAN_ICU_COMPILER_CACHE_DIR and
+        # CONAN_ICU_COMPILER_CACHE_MAXSIZE (e.g. 10G), otherwise the tool's defaults are used.
+        cache_tool = str(self.options.compiler_cache)
+        if not tools.which(cache_tool):
+            raise Exception("compiler_cache=%s but %s was not found in PATH." % (cache_tool, cache_tool))
+
+        cache_dir = os.environ.get('CONAN_ICU_COMPILER_CACHE_DIR')
+        cache_size = os.environ.get('CONAN_ICU_COMPILER_CACHE_MAXSIZE')
+        if cache_tool == 'ccache':
+            if cache_dir:
+                os.environ['CCACHE_DIR'] = cache_dir
+            if cache_size:
+                os.environ['CCACHE_MAXSIZE'] = cache_size
+            # every package id builds in its own folder, hash paths relative to it so they share hits
+            os.environ['CCACHE_BASEDIR'] = root_path
+        else:
+            if cache_dir:
+                os.environ['SCCACHE_DIR'] = cache_dir
+            if cache_size:
+                os.environ['SCCACHE_CACHE_SIZE'] = cache_size
+
+        if self.settings.os == 'Windows':
+            # runConfigureICU hardcodes cl for the MSVC platforms
+            tools.replace_in_file(runConfigureICU_file, 'CC=cl; export CC', 'CC="%s cl"; export CC' % cache_tool, strict=False)
+            tools.replace_in_file(runConfigureICU_file, 'CXX=cl; export CXX', 'CXX="%s cl"; export CXX' % cache_tool, strict=False)
+        else:
+            if str(self.settings.compiler) in ('clang', 'apple-clang'):
+                cc, cxx = 'clang', 'clang++'
+            else:
+                cc, cxx = 'gcc', 'g++'
+            os.environ['CC'] = '%s %s' % (cache_tool, os.environ.get('CC', cc))
+            os.environ['CXX'] = '%s %s' % (cache_tool, os.environ.get('CXX', cxx))
+
+        self.output.info("Compiling through %s" % cache_tool)
+        self.run(self.compiler_cache_cmd('zero'))
+
+    def setup_distcc(self):
+        # distcc_workers=<host>[:<port>][/<slots>],... compiles the translation units on those
+        # distccd workers (preprocessing and linking stay local, 4 slots per worker unless given).
+        # loopback[:<n>] starts <n> distccd workers on 127.0.0.1 instead (default 2) to try the
+        # distributed build on one machine. With compiler_cache=ccache, ccache runs distcc on its
+        # misses. Returns the started workers and their log files.
+        workers = str(self.options.distcc_workers).strip()
+        if not tools.which('distcc'):
+            raise Exception("distcc_workers=%s but distcc was not found in PATH." % workers)
+        distcc_dir = os.path.join(self.conanfile_directory, 'distcc')
+        if not os.path.isdir(distcc_dir):
+            os.makedirs(distcc_dir)
+        os.environ['DISTCC_DIR'] = distcc_dir
+
+        daemons = []
+        loopback = re.match(r'^loopback(?::(\d+))?$', workers)
+        if loopback:
+            if not tools.which('distccd'):
+                raise Exception("distcc_workers=%s but distccd was not found in PATH." % workers)
+            count = int(loopback.group(1) or 2)
+            slots = max(1, tools.cpu_count() // count)
+            # distcc 3.3+ only runs the compilers linked from /usr/lib/distcc unless told otherwise
+            insecure = '--enable-tcp-insecure' in subprocess.Popen(['distccd', '--help'], stdout=subprocess.PIPE,
+                                                                   stderr=subprocess.STDOUT).communicate()[0].decode('utf-8', 'replace')
+            hosts = []
+            for index in range(count):
+                port = self.free_port()
+                log_file = os.path.join(distcc_dir, 'distccd-%d.log' % index)
+                command = ['distccd', '--daemon', '--no-detach', '--listen', '127.0.0.1', '--allow', '127.0.0.1',
+                           '--port', str(port), '--jobs', str(slots), '--log-file', log_file, '--log-level', 'info']
+                if insecure:
+                    command.append('--enable-tcp-insecure')
+                daemons.append((subprocess.Popen(command), log_file))
+                hosts.append('127.0.0.1:%d/%d' % (port, slots))
+            # a broken worker must fail the build instead of distcc quietly compiling locally
+            os.environ['DISTCC_FALLBACK'] = '0'
+        else:
+            # commas separate the workers, except for distcc's own host options (host/8,lzo,cpp)
+            hosts = [host for host in re.split(r'\s+|,(?!lzo|cpp|auth)', workers) if host]
+        # what distcc runs locally (preprocessing, compiles it can't send) stays within make_jobs(),
+        # which is limited by the available memory
+        os.environ['DISTCC_HOSTS'] = ' '.join(['--localslots=%d' % self.make_jobs(),
+                                               '--localslots_cpp=%d' % self.make_jobs()] + hosts)
+        self.distcc_slots = sum(int(re.search(r'/(\d+)', host).group(1)) if re.search(r'/(\d+)', host) else 4
+                                for host in hosts)
+
+        if self.options.compiler_cache == 'ccache':
+            os.environ['CCACHE_PREFIX'] = 'distcc'
+        else:
+            if str(self.settings.compiler) in ('clang', 'apple-clang'):
+                cc, cxx = 'clang', 'clang++'
+            else:
+                cc, cxx = 'gcc', 'g++'
+            os.environ['CC'] = 'distcc %s' % os.environ.get('CC', cc)
+            os.environ['CXX'] = 'distcc %s' % os.environ.get('CXX', cxx)
+
+        self.output.info("Compiling through distcc on %s" % os.environ['DISTCC_HOSTS'])
+        return daemons
+
+    def stop_distcc_workers(self, daemons):
+        # stops the loopback workers and reports how many compilations each one did
+        for process, log_file in daemons:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            compiled = 0
+            if os.path.isfile(log_file):
+                with open(log_file) as f:
+                    compiled = len([line for line in f if 'COMPILE_OK' in line])
+            self.output.info("distcc worker %s: %d compilations" % (os.path.basename(log_file), compiled))
+
+    @staticmethod
+    def free_port():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+        finally:
+            sock.close()
+
+    def compiler_cache_cmd(self, action):
+        cache_tool = str(self.options.compiler_cache)
+        if action == 'zero':
+            return 'ccache -z' if cache_tool == 'ccache' else 'sccache --zero-stats'
+        return 'ccache -s' if cache_tool == 'ccache' else 'sccache --show-stats'
+
+    def print_compiler_cache_stats(self):
+        if self.options.compiler_cache != 'none':
+            self.output.info("Compiler cache statistics:")
+            self.run(self.compiler_cache_cmd('stats'))
+
+    def recipe_key(self):
+        # The fetched sources and the recipe (which patches them) identify the ICU source
+        # tree, so the persistent trees don't reuse a copy made by an older recipe or from
+        # other downloads
+        key = [('recipe', self.file_sha256(os.path.abspath(__file__).replace('.pyc', '.py')))]
+        for helper in sorted(glob.glob(os.path.join(self.conanfile_directory, 'helpers', '*'))):
+            key.append(('helpers/' + os.path.basename(helper), self.file_sha256(helper)))
+        digests_file = os.path.join(self.conanfile_directory, 'source_digests.json')
+        if os.path.isfile(digests_file):
+            with open(digests_file) as f:
+                key.extend(sorted(json.load(f).items()))
+        else:
+            self.output.warn("%s is missing, the shared build trees are only keyed by the recipe" % digests_file)
+        return key
+
+    def shared_build_key(self):
+        # Options which only change the data (or nothing) in the build tree are left out,
+        # so every data_packaging/data subset variant reuses the same compiled objects
+        data_only = ('data_packaging', 'data_locales', 'data_converters', 'silent', 'with_unit_tests', 'distcc_workers')
+        key = [(name, str(value)) for name, value in self.settings.values_list]
+        key.extend((name, str(value)) for name, value in self.options.values.as_list() if name not in data_only)
+        key.append(('CC', os.environ.get('CC', '')))
+        key.append(('CXX', os.environ.get('CXX', '')))
+        key.extend(self.recipe_key())
+        return hashlib.sha1(repr(sorted(key)).encode('utf-8')).hexdigest()
+
+    def use_shared_build_tree(self, shared_build_dir):
+        # With CONAN_ICU_SHARED_BUILD_DIR set, ICU is configured and built in a persistent
+        # tree (<dir>/<key>/source and <dir>/<key>/build) kept across conan builds.
+        # A later build for another data_packaging value re-runs configure and make in
+        # the same tree, which only rebuilds and repackages the data before installing
+        # into this build's output folder.
+        tree = os.path.join(shared_build_dir, '%s-%s' % (self.name, self.version), self.shared_build_key())
+        lock = self.lock_tree(tree)
+
+        try:
+            shared_source_dir = self.copy_source_tree(tree)
+        except Exception:
+            self.unlock_tree(lock)
+            raise
+
+        self.cfg['icu_source_dir'] = shared_source_dir
+        self.cfg['build_dir'] = os.path.join(tree, 'build')
+        return lock
+
+    def lock_tree(self, tree):
+        # Creates `tree` if needed and waits until this build is the only one using it.
+        # Returns the locked <tree>/.lock file, to be released with unlock_tree once done.
+        # The OS releases the lock when the process dies, so killed builds leave no stale lock.
+        if not os.path.isdir(tree):
+            try:
+                os.makedirs(tree)
+            except OSError:
+                if not os.path.isdir(tree):
+                    raise
+
+        lock = open(os.path.join(tree, '.lock'), 'a+')
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+                return lock
+            except (IOError, OSError):
+                self.output.info("Waiting for %s (used by another build)" % tree)
+                time.sleep(10)
+
+    @staticmethod
+    def unlock_tree(lock):
+        if fcntl:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        lock.close()
+
+    def copy_source_tree(self, tree):
+        # <tree>/source is a private copy of the ICU sources, so objects built in
+        # <tree>/build don't depend on this (temporary) conan build folder
+        source_dir = os.path.join(tree, 'source')
+        if not os.path.isdir(source_dir):
+            self.output.info("Creating build tree %s" % tree)
+            if os.path.isdir(source_dir + '.tmp'):
+                shutil.rmtree(source_dir + '.tmp')
+            shutil.copytree(self.cfg['icu_source_dir'], source_dir + '.tmp', symlinks=True)
+            os.rename(source_dir + '.tmp', source_dir)
+        else:
+            self.output.info("Reusing build tree %s" % tree)
+        return source_dir
+
+    def host_tools_key(self):
+        # Host tools only depend on the ICU sources and the native compiler
+        host_cc = os.environ.get('CC_FOR_BUILD', os.environ.get('CC', 'cc'))
+        try:
+            cc_version = subprocess.check_output('%s --version' % host_cc, shell=True).decode('utf-8', 'replace')
+        except subprocess.CalledProcessError:
+            cc_version = ''
+        key = [self.version, platform.system(), platform.machine(), host_cc, cc_version.splitlines()[0] if cc_version else '']
+        key.extend(self.recipe_key())
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def build_host_tools(self, host_tools_dir):
+        # With CONAN_ICU_HOST_TOOLS_DIR set, cross builds (including x86 on x86_64) use a
+        # native ICU build kept in <dir>/<key> for the data build (--with-cross-build),
+        # instead of building and running ICU's tools for every target architecture.
+        # Set CC_FOR_BUILD/CXX_FOR_BUILD when the target compiler can't build for the host.
+        tree = os.path.join(host_tools_dir, '%s-%s' % (self.name, self.version), self.host_tools_key())
+        host_build_dir = os.path.join(tree, 'build')
+        lock = self.lock_tree(tree)
+        try:
+            if os.path.isfile(os.path.join(host_build_dir, 'config', 'icucross.mk')) and \
+               os.path.isfile(os.path.join(tree, 'complete')):
+                self.output.info("Using ICU host tools from %s" % host_build_dir)
+                return host_build_dir
+
+            source_dir = self.copy_source_tree(tree)
+            if os.path.isdir(host_build_dir):
+                shutil.rmtree(host_build_dir)
+            os.mkdir(host_build_dir)
+
+            host_env = { 'CC': os.environ.get('CC_FOR_BUILD', os.environ.get('CC', 'cc')),
+                         'CXX': os.environ.get('CXX_FOR_BUILD', os.environ.get('CXX', 'c++')),
+                         'CFLAGS': '', 'CXXFLAGS': '', 'CPPFLAGS': '', 'LDFLAGS': '' }
+            host_platform = 'MacOSX' if platform.system() == 'Darwin' else 'Linux'
+            with tools.environment_append(host_env):
+                self.run_phase('host_tools_configure', "cd {builddir} && bash {source}/runConfigureICU {platform} "
+                                                       "--disable-extras --disable-samples --disable-tests "
+                                                       "--disable-layout --disable-layoutex".format(builddir=host_build_dir,
+                                                                                                    source=source_dir,
+                                                                                                    platform=host_platform))
+                self.run_phase('host_tools_make', "cd {builddir} && make {silent} -j {cpus_var}".format(builddir=host_build_dir,
+                                                                                                        silent=self.cfg['silent'],
+                                                                                                        cpus_var=self.make_jobs()))
+            open(os.path.join(tree, 'complete'), 'w').close()
+            return host_build_dir
+        finally:
+            self.unlock_tree(lock)
+
+    def make_jobs(self):
+        # Parallel make jobs: make_jobs=<n> if set, otherwise the cpus we may use (cpu count or
+        # CONAN_CPU_COUNT, cgroup cpu quota), scaled down when the host is oversubscribed (load
+        # average above its cpu count), limited by the available memory (MemAvailable, cgroup
+        # memory limit) divided by CONAN_ICU_MEMORY_PER_JOB_MB (default 1024, 2048 with LTO).
+        # Computed once per build.
+        if getattr(self, '_make_jobs', None):
+            return self._make_jobs
+
+        if str(self.options.make_jobs) != 'auto':
+            self._make_jobs = int(str(self.options.make_jobs))
+            self.output.info("Using %d make jobs (make_jobs option)" % self._make_jobs)
+            return self._make_jobs
+
+        cpus = tools.cpu_count()
+        reasons = ['%d cpus' % cpus]
+        quota = self.cgroup_cpu_quota()
+        if quota and quota < cpus:
+            cpus = quota
+            reasons.append('cgroup cpu quota %d' % quota)
+        jobs = cpus
+
+        if hasattr(os, 'getloadavg'):
+            # the load average is host wide (not per container), so it is only compared to the
+            # host's cpus: a busy host takes our share down in proportion, a loaded but not
+            # saturated one leaves it alone (parallel builds already split CONAN_CPU_COUNT)
+            load = os.getloadavg()[0]
+            host_cpus = multiprocessing.cpu_count()
+            if load > host_cpus:
+                jobs = max(1, int(jobs * host_cpus / load))
+                reasons.append('host load %.1f on %d cpus' % (load, host_cpus))
+
+        available = self.available_memory()
+        if available:
+            per_job = int(os.environ.get('CONAN_ICU_MEMORY_PER_JOB_MB', 2048 if self.options.with_pgo else 1024)) * 1024 * 1024
+            memory_jobs = max(1, available // per_job)
+            reasons.append('%d MB available, %d MB per job' % (available // (1024 * 1024), per_job // (1024 * 1024)))
+            jobs = min(jobs, memory_jobs)
+
+        self._make_jobs = int(jobs)
+        self.output.info("Using %d make jobs (%s)" % (self._make_jobs, ', '.join(reasons)))
+        return self._make_jobs
+
+    def compile_jobs(self):
+        # make jobs for the distcc_workers compilation of the common, i18n and io objects: the workers' slots
+        # when they outnumber the local jobs (with make_jobs=auto), 0 when there is no distcc
+        jobs = self.make_jobs()
+        slots = getattr(self, 'distcc_slots', 0)
+        if slots > jobs and str(self.options.make_jobs) == 'auto':
+            self.output.info("Using %d make jobs to compile on the distcc workers (%d slots)" % (slots, slots))
+            return slots
+        return jobs if slots else 0
+
+    @staticmethod
+    def read_cgroup_file(*paths):
+        # first line of the first readable file, None if there is none
+        for path in paths:
+            try:
+                with open(path) as f:
+                    return f.readline().strip()
+            except (IOError, OSError):
+                pass
+        return None
+
+    def cgroup_cpu_quota(self):
+        # cpus allowed by the cgroup (v2 cpu.max, v1 cfs quota/period), None when unlimited
+        cpu_max = self.read_cgroup_file('/sys/fs/cgroup/cpu.max')
+        if cpu_max:
+            quota, _, period = cpu_max.partition(' ')
+        else:
+            quota = self.read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_quota_us')
+            period = self.read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us', '/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_period_us')
+        try:
+            quota, period = int(quota), int(period)
+        except (TypeError, ValueError):
+            return None  # "max" or no cgroup
+        if quota <= 0 or period <= 0:
+            return None
+        return max(1, -(-quota // period))
+
+    def available_memory(self):
+        # bytes available to the build: MemAvailable, lowered to the cgroup limit minus its usage
+        available = None
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        available = int(line.split()[1]) * 1024
+        except (IOError, OSError):
+            return None
+
+        for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                       ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+            limit, usage = self.read_cgroup_file(limit_file), self.read_cgroup_file(usage_file)
+            try:
+                limit, usage = int(limit), int(usage)
+            except (TypeError, ValueError):
+                continue
+            # v1 reports "unlimited" as a huge number
+            if limit < (1 << 60):
+                cgroup_available = max(0, limit - usage)
+                available = cgroup_available if available is None else min(available, cgroup_available)
+            break
+        return available
+
+    def children_peak_rss_kb(self):
+        # peak RSS of the largest child process so far, in KB, None where unavailable.
+        # It's a high-water mark over the whole conan process, not per phase.
+        if not resource:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # KB on Linux, bytes on Macos
+        return peak_rss // 1024 if platform.system() == 'Darwin' else peak_rss
+
+    @contextmanager
+    def timed_phase(self, phase):
+        start = time.time()
+        peak_before = self.children_peak_rss_kb()
+        try:
+            yield
+        finally:
+            record = { 'phase': phase,
+                       'duration': round(time.time() - start, 3),
+                       'jobs': self.make_jobs() }
+            if resource:
+                # the high-water mark only says something about this phase when the phase raised it
+                peak_after = self.children_peak_rss_kb()
+                record['new_peak_rss_kb'] = peak_after if peak_after > peak_before else None
+            self.phase_timings.append(record)
+            self.output.info("Phase {0} took {1:.1f}s".format(phase, record['duration']))
+
+    def run_phase(self, phase, command):
+        with self.timed_phase(phase):
+            self.run(command)
+
+    def write_phase_timings(self, timings_file):
+        # package() merges the phases of source() and build(), which may have run in other processes
+        peaks = [record.get('new_peak_rss_kb') for record in self.phase_timings] + [self.children_peak_rss_kb()]
+        peaks = [peak for peak in peaks if peak is not None]
+        timings = { 'name': self.name,
+                    'version': self.version,
+                    'settings': dict((name, str(value)) for name, value in self.settings.values_list),
+                    'options': dict((name, str(value)) for name, value in self.options.values.as_list()),
+                    'phases': self.phase_timings,
+                    'children_peak_rss_kb': max(peaks) if peaks else None }
+        with open(timings_file, 'w') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+        self.output.info("Build timings: %s" % json.dumps(timings, sort_keys=True))
+
+    def cpu_flags(self):
+        # instruction set and optimization level flags for cpu_target and optimization
+        flags = []
+        if self.settings.os == 'Windows':
+            if self.options.cpu_target == 'x86-64-v3':
+                flags.append('-arch:AVX2')
+            if self.options.optimization != 'default':
+                flags.append({ 'O2': '-O2', 'O3': '-Ox', 'Os': '-O1' }[str(self.options.optimization)])
+        else:
+            flags.extend(self.cpu_target_flags[str(self.options.cpu_target)])
+            if self.options.optimization != 'default':
+                flags.append('-%s' % self.options.optimization)
+        return flags
+
+    def profiling_flags(self):
+        # profiling=True: keeps the optimization level, adds what sampling profilers and
+        # debuggers need to walk the stacks through ICU (frame pointers and unwind tables)
+        if self.settings.os == 'Windows':
+            # x64 code always has unwind tables, -Oy- only matters for x86
+            return ['-Oy-']
+        flags = ['-fno-omit-frame-pointer', '-funwind-tables', '-fasynchronous-unwind-tables']
+        if str(self.settings.arch) in ('x86', 'x86_64'):
+            flags.append('-mno-omit-leaf-frame-pointer')
+        return flags
+
+    def set_release_optimization(self, runConfigureICU_file):
+        # runConfigureICU appends its RELEASE_CFLAGS/RELEASE_CXXFLAGS (e.g. -O3, or -O2 for MSVC)
+        # after the flags from the environment, so the level is changed there as well
+        level = self.cpu_flags()[-1]
+        with open(runConfigureICU_file) as f:
+            content = f.read()
+        content = re.sub(r'(RELEASE_C(?:XX)?FLAGS=[\'"][^\'"]*?)-O[0-9sx]', r'\g<1>%s' % level, content)
+        with open(runConfigureICU_file, 'w') as f:
+            f.write(content)
+
+    def uconfig_defines(self):
+        return ['%s=1' % define for option, define in sorted(self.uconfig_features.items())
+                if not getattr(self.options, option)]
+
+    def data_subset(self, option_name):
+        # 'all' keeps the full ICU data, 'none' keeps nothing, otherwise a comma separated list
+        value = str(getattr(self.options, option_name)).strip()
+        if value == 'all':
+            return None
+        if value == 'none':
+            return []
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def read_data_file_list(self, mk_file):
+        # Returns the variables of an ICU data file list (VAR = a.txt b.txt \ ...)
+        variables = []
+        if not os.path.isfile(mk_file):
+            return variables
+        with open(mk_file) as f:
+            contents = re.sub(r'\\\s*\n', ' ', f.read())
+        for line in contents.splitlines():
+            match = re.match(r'^\s*(\w+)\s*=(.*)$', line)
+            if match:
+                variables.append((match.group(1), match.group(2).split()))
+        return variables
+
+    def write_data_file_list(self, mk_file, variables):
+        with open(mk_file, 'w') as f:
+            f.write('# Generated by the conan recipe from the data_locales/data_converters options\n')
+            for name, files in variables:
+                f.write('{0} = {1}\n'.format(name, ' '.join(files)))
+
+    def data_platform_name(self):
+        # name of the common data (icudt60l), all the supported architectures are little endian
+        return 'icudt%sl' % self.version.split('.')[0]
+
+    def data_cache_entry(self, cache_dir):
+        # <CONAN_ICU_DATA_CACHE>/<name>-<version>/<key>/icudt60l.dat, keyed by the data sources as
+        # subset_data() left them (data_locales and data_converters are in reslocal.mk & co) and
+        # the UCONFIG_NO_* switches the data tools are compiled with (genrb skips the collation
+        # data with UCONFIG_NO_COLLATION...). The common data archive holds every compiled item
+        # (.res, .cnv, .nrm...) and is the same for every compiler, build type, linkage and
+        # data_packaging.
+        data_dir = os.path.join(self.cfg['icu_source_dir'], 'data')
+        sha1 = hashlib.sha1(('%s-%s' % (self.name, self.version)).encode('utf-8'))
+        sha1.update(('uconfig: %s\0' % ' '.join(self.uconfig_defines())).encode('utf-8'))
+        for root, dirs, names in os.walk(data_dir):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, data_dir).replace('\\', '/')
+                if relpath == 'in/%s.dat' % self.data_platform_name():
+                    continue
+                sha1.update(('%s\0%d\0' % (relpath, os.path.getsize(path))).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    sha1.update(f.read())
+        return os.path.join(cache_dir, '%s-%s' % (self.name, self.version), sha1.hexdigest(),
+                            '%s.dat' % self.data_platform_name())
+
+    def store_cached_data(self, entry):
+        # data_packaging=archive leaves the archive in data/out/ (build() removed any earlier one
+        # before making it), for the other packagings it is
+        # made from the compiled items pkgdata got (data/out/tmp/icudata.lst, data/out/build/icudt60l/)
+        name = self.data_platform_name()
+        out_dir = os.path.join(self.cfg['build_dir'], 'data', 'out')
+        # icupkg names the items after the output file, so it is written as icudt60l.dat in a temporary folder
+        tmp_dir = os.path.join(os.path.dirname(entry), 'tmp-%s' % uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            if os.path.isfile(os.path.join(out_dir, '%s.dat' % name)):
+                shutil.copyfile(os.path.join(out_dir, '%s.dat' % name), os.path.join(tmp_dir, '%s.dat' % name))
+            else:
+                item_list = os.path.join(out_dir, 'tmp', 'icudata.lst')
+                items_dir = os.path.join(out_dir, 'build', name)
+                if not os.path.isfile(item_list) or not os.path.isdir(items_dir):
+                    self.output.warn("No compiled ICU data found in %s, nothing cached" % out_dir)
+                    return
+                # cross builds can only run the host tools
+                tools_dir = self.cfg.get('host_tools_dir') or self.cfg['build_dir']
+                lib_dirs = [os.path.join(tools_dir, 'lib'), os.path.join(tools_dir, 'bin')]
+                with tools.environment_append({'LD_LIBRARY_PATH': lib_dirs, 'DYLD_LIBRARY_PATH': lib_dirs, 'PATH': lib_dirs}):
+                    self.run('"{icupkg}" -tl --ignore-deps -s "{items}" -a "{items_list}" new "{archive}"'.format(
+                             icupkg=os.path.join(tools_dir, 'bin', 'icupkg'), items=items_dir, items_list=item_list,
+                             archive=os.path.join(tmp_dir, '%s.dat' % name)))
+            if os.path.isfile(entry):
+                # another build cached the same data meanwhile
+                return
+            os.rename(os.path.join(tmp_dir, '%s.dat' % name), entry)
+            self.output.info("Cached the compiled ICU data in %s" % entry)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def subset_data(self, data_dir):
+        # ICU doesn't ship the local lists, drop the ones a previous subset wrote (shared build tree)
+        generated = [os.path.join(data_dir, tree, local_list) for tree, (_, local_list) in self.data_locale_lists.items()]
+        generated.append(os.path.join(data_dir, 'mappings', 'ucmlocal.mk'))
+        for local_list in generated:
+            if os.path.isfile(local_list):
+                os.remove(local_list)
+
+        locales = self.data_subset('data_locales')
+        if locales is not None:
+            # the parents of a requested locale are needed for fallback (en for en_US)
+            parents = set()
+            for locale in locales:
+                parts = locale.split('_')
+                parents.update('_'.join(parts[:i]) for i in range(1, len(parts)))
+
+            def keep_locale(filename):
+                if not filename.endswith('.txt'):
+                    return True
+                stem = filename[:-len('.txt')]
+                # rules and dictionaries in brkitr are not locale bundles
+                if not re.match(r'^[a-z]{2,3}(_\w+)?$', stem):
+                    return True
+                return stem in parents or \
+                       any(stem == locale or stem.startswith(locale + '_') for locale in locales)
+
+            self.output.info('Keeping ICU locale data for: %s' % (', '.join(locales) or 'root only'))
+            for tree, (file_list, local_list) in self.data_locale_lists.items():
+                variables = self.read_data_file_list(os.path.join(data_dir, tree, file_list))
+                if variables:
+                    self.write_data_file_list(os.path.join(data_dir, tree, local_list),
+                                              [(name, [f for f in files if keep_locale(f)]) for name, files in variables])
+
+        converters = self.data_subset('data_converters')
+        if converters is not None:
+            def keep_converter(filename):
+                if not filename.endswith('.ucm'):
+                    return True
+                stem = filename[:-len('.ucm')].lower()
+                return any(fnmatch.fnmatch(stem, pattern.lower()) for pattern in converters)
+
+            # UTF-8/16/32, US-ASCII and ISO-8859-1 are algorithmic and always available
+            self.output.info('Keeping ICU converter tables for: %s' % (', '.join(converters) or 'none'))
+            variables = []
+            for file_list in self.data_converter_lists:
+                variables.extend(self.read_data_file_list(os.path.join(data_dir, 'mappings', file_list)))
+            if variables:
+                self.write_data_file_list(os.path.join(data_dir, 'mappings', 'ucmlocal.mk'),
+                                          [(name, [f for f in files if keep_converter(f)]) for name, files in variables])
+
+    def run_unit_tests(self, shell):
+        # Replaces a serial `make check`: the test programs are built first, then every
+        # test suite (intltest is split into its sub-suites) runs as a separate shard,
+        # CONAN_ICU_TEST_JOBS (default: the make job count) at a time. `shell` runs {command} in
+        # the build directory. Results are written to unit_tests.json.
+        jobs = int(os.environ.get('CONAN_ICU_TEST_JOBS', self.make_jobs()))
+        log_dir = os.path.join(self.cfg['build_dir'], 'test-logs')
+        if os.path.isdir(log_dir):
+            shutil.rmtree(log_dir)
+        os.mkdir(log_dir)
+
+        self.run_phase('make_check_build', shell.format(command='make {silent} -j {jobs} -C test all'.format(silent=self.cfg['silent'],
+                                                                                                               jobs=jobs)))
+
+        with self.timed_phase('make_check'):
+            shards = []
+            for suite, opts_var in self.unit_test_suites:
+                if suite == 'iotest' and not self.options.with_icuio:
+                    # configure leaves test/iotest out of the build without icuio
+                    continue
+                for path in self.unit_test_shards(shell, suite, opts_var):
+                    shards.append({ 'suite': suite, 'path': path, 'opts_var': opts_var })
+            self.output.info("Running %d test shards, %d at a time" % (len(shards), jobs))
+
+            pending = list(shards)
+            lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        shard = pending.pop(0)
+                    name = shard['suite'] + ('/' + shard['path'] if shard['path'] else '')
+                    shard['log'] = os.path.join(log_dir, name.replace('/', '_') + '.log')
+                    command = 'make -C test/{suite} check {opts_var}={path}'.format(**shard)
+                    start = time.time()
+                    with open(shard['log'], 'w') as log:
+                        shard['passed'] = subprocess.call(shell.format(command=command), shell=True,
+                                                          stdout=log, stderr=subprocess.STDOUT) == 0
+                    shard['duration'] = round(time.time() - start, 3)
+                    with lock:
+                        self.output.info("%s %s (%.1fs)" % ('PASS' if shard['passed'] else 'FAIL', name, shard['duration']))
+
+            threads = [threading.Thread(target=worker) for _ in range(max(1, min(jobs, len(shards))))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        report = [{ 'suite': shard['suite'], 'shard': shard['path'], 'duration': shard['duration'],
+                    'passed': shard['passed'], 'log': shard['log'] } for shard in shards]
+        with open(os.path.join(self.conanfile_directory, 'unit_tests.json'), 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+        self.output.info("Unit test summary (slowest first):")
+        for shard in sorted(report, key=lambda shard: -shard['duration']):
+            self.output.info("  %-6s %8.1fs  %s %s" % ('ok' if shard['passed'] else 'FAILED', shard['duration'],
+                                                       shard['suite'], shard['shard']))
+
+        failures = [shard for shard in report if not shard['passed']]
+        if failures:
+            lines = []
+            for shard in failures:
+                failed_tests = self.failed_unit_tests(shard['log'])
+                lines.append("  %s %s: %s (%s)" % (shard['suite'], shard['shard'],
+                                                   ', '.join(failed_tests) if failed_tests else 'failed', shard['log']))
+            raise Exception("Unit tests failed:\n%s" % "\n".join(lines))
+
+    def unit_test_shards(self, shell, suite, opts_var):
+        # intltest lists its tests with the LIST argument (<suite>/LIST for the sub-suites);
+        # the other programs are quick enough to run as one shard
+        if suite != 'intltest':
+            return ['']
+
+        def list_tests(path):
+            command = 'make -C test/{suite} check {opts_var}={path}LIST'.format(suite=suite, opts_var=opts_var, path=path)
+            try:
+                output = subprocess.check_output(shell.format(command=command), shell=True,
+                                                 stderr=subprocess.STDOUT).decode('utf-8', 'replace')
+            except subprocess.CalledProcessError:
+                return []
+            names = []
+            listing = False
+            for line in output.splitlines():
+                if line.strip().startswith('-----'):
+                    listing = True
+                elif listing:
+                    if not line.strip():
+                        break
+                    names.append(line.strip())
+            return [name for name in names if re.match(r'^\w+$', name)]
+
+        shards = []
+        for name in list_tests(''):
+            sub_names = list_tests(name + '/')
+            shards.extend(['%s/%s' % (name, sub_name) for sub_name in sub_names] or [name])
+        return shards or ['']
+
+    @staticmethod
+    def failed_unit_tests(log_file):
+        # The ICU test frameworks end with an "Errors in ..." section listing the failed tests
+        failed = []
+        with open(log_file) as f:
+            lines = f.read().splitlines()
+        for index, line in enumerate(lines):
+            if 'Errors in' in line:
+                for test in lines[index + 1:]:
+                    if not test.startswith((' ', '\t')) or not test.strip():
+                        break
+                    failed.append(test.strip())
+        return failed[:10]
+
     def build_msys(self):
         self.cfg['platform'] = 'MSYS/MSVC'
 
@@ -268,28 +1646,30 @@ class IcuConan(ConanFile):
         os.environ['PATH'] = os.path.join(os.environ['MSYS_ROOT'], 'usr', 'bin') + os.pathsep + \
                              os.environ['PATH']
 
-        os.mkdir(self.cfg['build_dir'])
+        if not os.path.isdir(self.cfg['build_dir']):
+            os.mkdir(self.cfg['build_dir'])
 
         self.cfg['host'] = '--host=i686-pc-mingw{0}'.format(self.cfg['arch_bits'])
 
         config_cmd = self.build_config_cmd()
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'{config_cmd}^'".format(vccmd=self.cfg['vccmd'],
-                                                                               builddir=self.cfg['build_dir'],
-                                                                               config_cmd=config_cmd))
+        self.run_phase('configure', "{vccmd} && cd {builddir} && bash -c ^'{config_cmd}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                  builddir=self.cfg['build_dir'],
+                                                                                                  config_cmd=config_cmd))
+
+        self.run_phase('make', "{vccmd} && cd {builddir} && bash -c ^'make {silent} -j {cpus_var}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                            builddir=self.cfg['build_dir'],
+                                                                                                            silent=self.cfg['silent'],
+                                                                                                            cpus_var=self.make_jobs()))
+        self.print_compiler_cache_stats()
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} -j {cpus_var}^'".format(vccmd=self.cfg['vccmd'],
-                                                                                              builddir=self.cfg['build_dir'],
-                                                                                              silent=self.cfg['silent'],
-                                                                                              cpus_var=tools.cpu_count()))
         if self.options.with_unit_tests:
-            self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} check^'".format(vccmd=self.cfg['vccmd'],
-                                                                                          builddir=self.cfg['build_dir'],
-                                                                                          silent=self.cfg['silent']))
+            self.run_unit_tests("{vccmd} && cd {builddir} && bash -c ^'{{command}}^'".format(vccmd=self.cfg['vccmd'],
+                                                                                            builddir=self.cfg['build_dir']))
 
-        self.run("{vccmd} && cd {builddir} && bash -c ^'make {silent} install^'".format(vccmd=self.cfg['vccmd'],
-                                                                                        builddir=self.cfg['build_dir'],
-                                                                                        silent=self.cfg['silent']))
+        self.run_phase('make_install', "{vccmd} && cd {builddir} && bash -c ^'make {silent} install^'".format(vccmd=self.cfg['vccmd'],
+                                                                                                              builddir=self.cfg['build_dir'],
+                                                                                                              silent=self.cfg['silent']))
 
 
     def build_cygwin(self):
@@ -307,61 +1687,199 @@ class IcuConan(ConanFile):
                              os.path.join(os.environ['CYGWIN_ROOT'], 'usr', 'bin') + os.pathsep + \
                              os.environ['PATH']
 
-        os.mkdir(self.cfg['build_dir'])
+        if not os.path.isdir(self.cfg['build_dir']):
+            os.mkdir(self.cfg['build_dir'])
 
         self.output.info("Starting configuration.")
 
         config_cmd = self.build_config_cmd()
-        self.run("{vccmd} && cd {builddir} && bash -c '{config_cmd}'".format(vccmd=self.cfg['vccmd'],
-                                                                             builddir=self.cfg['build_dir'],
-                                                                             config_cmd=config_cmd))
+        self.run_phase('configure', "{vccmd} && cd {builddir} && bash -c '{config_cmd}'".format(vccmd=self.cfg['vccmd'],
+                                                                                                builddir=self.cfg['build_dir'],
+                                                                                                config_cmd=config_cmd))
 
         self.output.info("Starting built.")
 
 
-        self.run("{vccmd} && cd {builddir} && make {silent} -j {cpus_var}".format(vccmd=self.cfg['vccmd'],
-                                                                                  builddir=self.cfg['build_dir'],
-                                                                                  silent=self.cfg['silent'],
-                                                                                  cpus_var=tools.cpu_count()))
+        self.run_phase('make', "{vccmd} && cd {builddir} && make {silent} -j {cpus_var}".format(vccmd=self.cfg['vccmd'],
+                                                                                                builddir=self.cfg['build_dir'],
+                                                                                                silent=self.cfg['silent'],
+                                                                                                cpus_var=self.make_jobs()))
+        self.print_compiler_cache_stats()
+
         if self.options.with_unit_tests:
-            self.run("{vccmd} && cd {builddir} && make {silent} check".format(vccmd=self.cfg['vccmd'],
-                                                                              builddir=self.cfg['build_dir'],
-                                                                              silent=self.cfg['silent']))
+            self.run_unit_tests("{vccmd} && cd {builddir} && bash -c '{{command}}'".format(vccmd=self.cfg['vccmd'],
+                                                                                          builddir=self.cfg['build_dir']))
 
-        self.run("{vccmd} && cd {builddir} && make {silent} install".format(vccmd=self.cfg['vccmd'],
-                                                                            builddir=self.cfg['build_dir'],
-                                                                            silent=self.cfg['silent']))
+        self.run_phase('make_install', "{vccmd} && cd {builddir} && make {silent} install".format(vccmd=self.cfg['vccmd'],
+                                                                                                  builddir=self.cfg['build_dir'],
+                                                                                                  silent=self.cfg['silent']))
             
 
     def build_unix(self):
         env_build = AutoToolsBuildEnvironment(self)
-        with tools.environment_append(env_build.vars):
-            if self.settings.os == 'Linux':
-                self.cfg['platform'] = 'Linux/gcc' if str(self.settings.compiler).startswith('gcc') else 'Linux'
-            elif self.settings.os == 'Macos':
-                self.cfg['platform'] = 'MacOSX'
+        env_build.defines.extend(self.cfg['defines'])
+        env_build.flags.extend(self.cfg['flags'])
+        if self.settings.os == 'Linux':
+            self.cfg['platform'] = 'Linux/gcc' if str(self.settings.compiler).startswith('gcc') else 'Linux'
+        elif self.settings.os == 'Macos':
+            self.cfg['platform'] = 'MacOSX'
 
-            os.mkdir(self.cfg['build_dir'])
+        if os.environ.get('CONAN_ICU_HOST_TOOLS_DIR') and tools.cross_building(self.settings):
+            host_build_dir = self.build_host_tools(os.environ['CONAN_ICU_HOST_TOOLS_DIR'])
+            self.cfg['host_tools_dir'] = host_build_dir
+            self.cfg['general_opts'] += ' --with-cross-build=%s' % host_build_dir
+            if not self.options.with_tools:
+                # the data is built with the host tools, the target ones are only needed in the package
+                self.cfg['general_opts'] += ' --disable-tools'
+
+        distcc_daemons = self.setup_distcc() if self.options.distcc_workers != 'none' else []
+        try:
+            if self.options.with_pgo:
+                self.build_unix_pgo(env_build)
+            else:
+                self.build_unix_pass(env_build)
+        finally:
+            self.stop_distcc_workers(distcc_daemons)
+
+        if self.settings.os == 'Macos':
+            with tools.chdir('output/lib'):
+                for dylib in glob.glob('*icu*.{0}.dylib'.format(self.version)):
+                    self.run('install_name_tool -id {0} {1}'.format(
+                        os.path.basename(dylib), dylib))
+
+    def build_unix_pass(self, env_build, phase_prefix='', run_tests=True):
+        with tools.environment_append(env_build.vars):
+            if not os.path.isdir(self.cfg['build_dir']):
+                os.mkdir(self.cfg['build_dir'])
 
             config_cmd = self.build_config_cmd()
 
             # with tools.environment_append(env_build.vars):
-            self.run("cd {builddir} && bash {config_cmd}".format(builddir=self.cfg['build_dir'],
-                                                                 config_cmd=config_cmd))
+            self.run_phase(phase_prefix + 'configure', "cd {builddir} && bash {config_cmd}".format(builddir=self.cfg['build_dir'],
+                                                                                                   config_cmd=config_cmd))
 
-            self.run("cd {builddir} && make {silent} -j {cpus_var}".format(builddir=self.cfg['build_dir'],
-                                                                           cpus_var=tools.cpu_count(),
-                                                                           silent=self.cfg['silent']))
+            distcc_jobs = self.compile_jobs()
+            if distcc_jobs:
+                # the libraries' objects hold nearly all the compilations and are compiled at the workers'
+                # -j first. Only the objects ($(OBJECTS) of each library Makefile): the links, tools and
+                # data build below stay within the memory limited make_jobs()
+                objects_makefile = os.path.join(self.cfg['build_dir'], 'conan_objects.mk')
+                with open(objects_makefile, 'w') as f:
+                    f.write("# read after a library's Makefile: compiles its objects without linking it\n"
+                            "conan-objects: $(OBJECTS)\n")
+                library_dirs = ['common', 'i18n'] + (['io'] if self.options.with_icuio else [])
+                self.run_phase(phase_prefix + 'make_distcc', "cd {builddir} && {libraries}".format(
+                    builddir=self.cfg['build_dir'],
+                    libraries=' && '.join('make {silent} -j {jobs} -C {dir} -f Makefile -f {objects} conan-objects'.format(
+                                              silent=self.cfg['silent'], jobs=distcc_jobs, dir=dir, objects=objects_makefile)
+                                          for dir in library_dirs)))
+
+            self.run_phase(phase_prefix + 'make', "cd {builddir} && make {silent} -j {cpus_var}".format(builddir=self.cfg['build_dir'],
+                                                                                                        cpus_var=self.make_jobs(),
+                                                                                                        silent=self.cfg['silent']))
+            self.print_compiler_cache_stats()
+
+            if self.options.with_unit_tests and run_tests:
+                self.run_unit_tests("cd {builddir} && {{command}}".format(builddir=self.cfg['build_dir']))
+
+            self.run_phase(phase_prefix + 'make_install', "cd {builddir} && make {silent} install".format(builddir=self.cfg['build_dir'],
+                                                                                                          silent=self.cfg['silent']))
+
+    def build_unix_pgo(self, env_build):
+        # Two stage build: an instrumented ICU runs helpers/pgo_training.cpp, then ICU is
+        # rebuilt from scratch with the collected profile and link-time optimization.
+        clang = str(self.settings.compiler) in ('clang', 'apple-clang')
+        profile_dir = os.path.join(self.conanfile_directory, 'pgo-profile')
+        if os.path.isdir(profile_dir):
+            shutil.rmtree(profile_dir)
+        os.mkdir(profile_dir)
+
+        if clang:
+            generate_flags = ['-fprofile-instr-generate=%s' % os.path.join(profile_dir, 'icu-%p.profraw')]
+        else:
+            generate_flags = ['-fprofile-generate=%s' % profile_dir]
 
-            if self.options.with_unit_tests:
-                self.run("cd {builddir} && make {silent} check".format(builddir=self.cfg['build_dir'],
-                                                                       silent=self.cfg['silent']))
+        flags, cxx_flags, link_flags = list(env_build.flags), list(env_build.cxx_flags), list(env_build.link_flags)
+
+        env_build.flags.extend(generate_flags)
+        env_build.link_flags.extend(generate_flags)
+        self.build_unix_pass(env_build, phase_prefix='pgo_instrumented_', run_tests=False)
+
+        with self.timed_phase('pgo_training'):
+            self.run_pgo_training(env_build, generate_flags)
+
+        if clang:
+            profdata = os.path.join(profile_dir, 'icu.profdata')
+            llvm_profdata = 'xcrun llvm-profdata' if self.settings.os == 'Macos' else 'llvm-profdata'
+            self.run('{0} merge -output={1} {2}'.format(llvm_profdata, profdata, os.path.join(profile_dir, '*.profraw')))
+            use_flags = ['-fprofile-instr-use=%s' % profdata]
+        else:
+            use_flags = ['-fprofile-use=%s' % profile_dir, '-fprofile-correction']
+
+        # Static libraries keep regular object code next to the LTO bytecode (gcc) so consumers
+        # don't need LTO to link them; clang only gets LTO where its linker understands bitcode.
+        lto_env = {}
+        if not clang:
+            lto_flags = ['-flto=%s' % self.make_jobs()]
+            if not self.options.shared:
+                # archives of LTO objects need the plugin aware ar/ranlib of the same gcc
+                lto_flags.append('-ffat-lto-objects')
+                for tool in ('ar', 'ranlib'):
+                    if tool.upper() not in os.environ:
+                        lto_env[tool.upper()] = self.gcc_tool(tool)
+        elif self.options.shared and self.settings.os == 'Macos':
+            lto_flags = ['-flto=thin']
+        elif self.options.shared and tools.which('ld.lld'):
+            lto_flags = ['-flto=thin', '-fuse-ld=lld']
+        else:
+            self.output.warn("LTO skipped for this clang configuration, building with PGO only")
+            lto_flags = []
+
+        env_build.flags, env_build.cxx_flags, env_build.link_flags = flags, cxx_flags, link_flags
+        env_build.flags.extend(use_flags + lto_flags)
+        env_build.link_flags.extend(use_flags + lto_flags)
+
+        shutil.rmtree(self.cfg['build_dir'])
+        shutil.rmtree(self.cfg['output_dir'])
+        with tools.environment_append(lto_env):
+            self.build_unix_pass(env_build)
+
+    def gcc_tool(self, tool):
+        # gcc-ar/gcc-ranlib matching $CC: gcc-5 -> gcc-ar-5, x86_64-linux-gnu-gcc -> x86_64-linux-gnu-gcc-ar
+        # (skipping the compiler cache or distcc wrapper and any flags in $CC)
+        cc = [word for word in os.environ.get('CC', 'gcc').split()
+              if not word.startswith('-') and os.path.basename(word) not in ('ccache', 'sccache', 'distcc')]
+        cc_dir, cc_name = os.path.split(cc[0] if cc else 'gcc')
+        tool_name = re.sub(r'gcc(?=(-[0-9.]+)?$)', 'gcc-%s' % tool, cc_name)
+        if tool_name != cc_name:
+            if tools.which(os.path.join(cc_dir, tool_name)):
+                return os.path.join(cc_dir, tool_name)
+            self.output.warn("%s not found, using gcc-%s" % (os.path.join(cc_dir, tool_name), tool))
+        return 'gcc-%s' % tool
+
+    def run_pgo_training(self, env_build, generate_flags):
+        output_dir = self.cfg['output_dir']
+        training_exe = os.path.join(self.conanfile_directory, 'pgo_training')
+        libs = '-licui18n -licuuc -licudata'
+        if not self.options.shared:
+            libs = '-DU_STATIC_IMPLEMENTATION ' + libs
+            if self.settings.os == 'Linux':
+                libs += ' -ldl -lpthread'
 
-            self.run("cd {builddir} && make {silent} install".format(builddir=self.cfg['build_dir'],
-                                                                     silent=self.cfg['silent']))
+        compile_cmd = '{cxx} -O2 -std=c++11 {arch} {defines} {flags} -I{include} {source} -o {exe} -L{lib} {libs}'.format(
+            cxx=os.environ.get('CXX', 'clang++' if str(self.settings.compiler) in ('clang', 'apple-clang') else 'g++'),
+            arch='-m64' if self.settings.arch == 'x86_64' else '-m32',
+            defines=' '.join('-D%s' % define for define in self.cfg['defines']),
+            flags=' '.join(generate_flags),
+            include=os.path.join(output_dir, 'include'),
+            source=os.path.join(self.conanfile_directory, 'helpers', 'pgo_training.cpp'),
+            exe=training_exe,
+            lib=os.path.join(output_dir, 'lib'),
+            libs=libs)
+        self.run(compile_cmd)
 
-            if self.settings.os == 'Macos':
-                with tools.chdir('output/lib'):
-                    for dylib in glob.glob('*icu*.{0}.dylib'.format(self.version)):
-                        self.run('install_name_tool -id {0} {1}'.format(
-                            os.path.basename(dylib), dylib))
+        lib_dir = os.path.join(output_dir, 'lib')
+        with tools.environment_append({'LD_LIBRARY_PATH': lib_dir,
+                                       'DYLD_LIBRARY_PATH': lib_dir,
+                                       'ICU_DATA': os.path.join(output_dir, 'share', self.name, self.version)}):
+            self.run(training_exe)
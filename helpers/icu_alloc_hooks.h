@@ -0,0 +1,258 @@
+/*
+ * Header-only helper shipped with the conan ICU package (option with_alloc_hooks).
+ *
+ * Installs u_setMemoryFunctions() hooks which count ICU's heap allocations
+ * (calls, bytes, current and peak usage) and can serve small allocations from
+ * per-thread pools instead of malloc. Define ICU_ALLOC_HOOKS_IMPLEMENTATION in
+ * exactly one source file before including it, and install the hooks before
+ * any other ICU function is called:
+ *
+ *     #define ICU_ALLOC_HOOKS_IMPLEMENTATION
+ *     #include "icu_alloc_hooks.h"
+ *
+ *     UErrorCode status = U_ZERO_ERROR;
+ *     icu_alloc_hooks_install(ICU_ALLOC_POOL, &status);
+ *
+ * ICU_ALLOC_POOL keeps blocks of up to 256 bytes in size classes of 16 bytes,
+ * carved from 64 KB chunks. Freed blocks go to the free list of the freeing
+ * thread and the chunks are never returned to the system.
+ */
+
+#ifndef ICU_ALLOC_HOOKS_H
+#define ICU_ALLOC_HOOKS_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "unicode/utypes.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+typedef enum {
+    ICU_ALLOC_MALLOC = 0, /* count only, allocate with malloc */
+    ICU_ALLOC_POOL = 1    /* count, small allocations from per-thread pools */
+} icu_alloc_strategy;
+
+typedef struct {
+    int64_t allocs;    /* allocations (uprv_malloc, uprv_realloc of NULL) */
+    int64_t reallocs;  /* uprv_realloc of an allocated block */
+    int64_t frees;     /* uprv_free of an allocated block */
+    int64_t bytes;     /* bytes requested by allocs and reallocs */
+    int64_t current;   /* bytes currently allocated */
+    int64_t peak;      /* highest `current` since the last reset */
+    int64_t pool_hits; /* allocations served from a pool free list */
+} icu_alloc_stats;
+
+/* Returns non-zero on success; call it before any other ICU function */
+UBool icu_alloc_hooks_install(icu_alloc_strategy strategy, UErrorCode *status);
+
+/* Copies the counters */
+void icu_alloc_hooks_stats(icu_alloc_stats *stats);
+
+/* Zeroes the counters, except `current`; `peak` restarts from `current` */
+void icu_alloc_hooks_reset(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+#ifdef ICU_ALLOC_HOOKS_IMPLEMENTATION
+
+#include <stdlib.h>
+#include <string.h>
+
+#include "unicode/uclean.h"
+
+#ifdef _MSC_VER
+#include <windows.h>
+#define ICU_ALLOC_HOOKS_TLS __declspec(thread)
+#define ICU_ALLOC_HOOKS_ADD(counter, value) \
+    (InterlockedExchangeAdd64((volatile LONGLONG *)(counter), (LONGLONG)(value)) + (LONGLONG)(value))
+#define ICU_ALLOC_HOOKS_STORE(counter, value) InterlockedExchange64((volatile LONGLONG *)(counter), (LONGLONG)(value))
+#define ICU_ALLOC_HOOKS_CAS(counter, expected, desired) \
+    (InterlockedCompareExchange64((volatile LONGLONG *)(counter), (LONGLONG)(desired), (LONGLONG)(expected)) == (LONGLONG)(expected))
+#else
+#define ICU_ALLOC_HOOKS_TLS __thread
+#define ICU_ALLOC_HOOKS_ADD(counter, value) __atomic_add_fetch((counter), (value), __ATOMIC_RELAXED)
+#define ICU_ALLOC_HOOKS_STORE(counter, value) __atomic_store_n((counter), (value), __ATOMIC_RELAXED)
+#define ICU_ALLOC_HOOKS_CAS(counter, expected, desired) \
+    __atomic_compare_exchange_n((counter), &(expected), (desired), 0, __ATOMIC_RELAXED, __ATOMIC_RELAXED)
+#endif
+
+#define ICU_ALLOC_HOOKS_LOAD(counter) ICU_ALLOC_HOOKS_ADD(counter, 0)
+
+#define ICU_ALLOC_HOOKS_CLASS_SIZE 16
+#define ICU_ALLOC_HOOKS_CLASSES 16
+#define ICU_ALLOC_HOOKS_CHUNK (64 * 1024)
+
+/* Precedes every block; 16 bytes keep the payload as aligned as malloc's */
+typedef union icu_alloc_header {
+    struct {
+        size_t size;       /* requested size */
+        size_t size_class; /* 1..ICU_ALLOC_HOOKS_CLASSES for pooled blocks, 0 for malloc'ed ones */
+    } h;
+    char align[16];
+} icu_alloc_header;
+
+static icu_alloc_strategy icu_alloc_hooks_strategy = ICU_ALLOC_MALLOC;
+static icu_alloc_stats icu_alloc_hooks_counters;
+
+static ICU_ALLOC_HOOKS_TLS icu_alloc_header *icu_alloc_hooks_free_lists[ICU_ALLOC_HOOKS_CLASSES];
+static ICU_ALLOC_HOOKS_TLS char *icu_alloc_hooks_chunk;
+static ICU_ALLOC_HOOKS_TLS size_t icu_alloc_hooks_chunk_left;
+
+static void icu_alloc_hooks_track(int64_t delta) {
+    int64_t current = ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.current, delta);
+    int64_t peak = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.peak);
+    while (current > peak) {
+        if (ICU_ALLOC_HOOKS_CAS(&icu_alloc_hooks_counters.peak, peak, current)) {
+            break;
+        }
+        peak = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.peak);
+    }
+}
+
+/* A block for `size` bytes, uncounted */
+static icu_alloc_header *icu_alloc_hooks_block(size_t size) {
+    icu_alloc_header *header;
+    size_t size_class = 0;
+
+    if (icu_alloc_hooks_strategy == ICU_ALLOC_POOL && size <= ICU_ALLOC_HOOKS_CLASS_SIZE * ICU_ALLOC_HOOKS_CLASSES) {
+        size_class = size == 0 ? 1 : (size + ICU_ALLOC_HOOKS_CLASS_SIZE - 1) / ICU_ALLOC_HOOKS_CLASS_SIZE;
+        header = icu_alloc_hooks_free_lists[size_class - 1];
+        if (header != NULL) {
+            icu_alloc_hooks_free_lists[size_class - 1] = *(icu_alloc_header **)(header + 1);
+            ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.pool_hits, 1);
+        } else {
+            size_t block_size = sizeof(icu_alloc_header) + size_class * ICU_ALLOC_HOOKS_CLASS_SIZE;
+            if (icu_alloc_hooks_chunk_left < block_size) {
+                /* the rest of the previous chunk is left unused */
+                icu_alloc_hooks_chunk = (char *)malloc(ICU_ALLOC_HOOKS_CHUNK);
+                if (icu_alloc_hooks_chunk == NULL) {
+                    icu_alloc_hooks_chunk_left = 0;
+                    return NULL;
+                }
+                icu_alloc_hooks_chunk_left = ICU_ALLOC_HOOKS_CHUNK;
+            }
+            header = (icu_alloc_header *)icu_alloc_hooks_chunk;
+            icu_alloc_hooks_chunk += block_size;
+            icu_alloc_hooks_chunk_left -= block_size;
+        }
+    } else {
+        header = (icu_alloc_header *)malloc(sizeof(icu_alloc_header) + size);
+        if (header == NULL) {
+            return NULL;
+        }
+    }
+    header->h.size = size;
+    header->h.size_class = size_class;
+    return header;
+}
+
+/* Gives a block back, uncounted */
+static void icu_alloc_hooks_release(icu_alloc_header *header) {
+    size_t size_class = header->h.size_class;
+    if (size_class != 0) {
+        *(icu_alloc_header **)(header + 1) = icu_alloc_hooks_free_lists[size_class - 1];
+        icu_alloc_hooks_free_lists[size_class - 1] = header;
+    } else {
+        free(header);
+    }
+}
+
+static void *U_CALLCONV icu_alloc_hooks_malloc(const void *context, size_t size) {
+    icu_alloc_header *header = icu_alloc_hooks_block(size);
+    (void)context;
+    if (header == NULL) {
+        return NULL;
+    }
+    ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.allocs, 1);
+    ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.bytes, (int64_t)size);
+    icu_alloc_hooks_track((int64_t)size);
+    return header + 1;
+}
+
+static void U_CALLCONV icu_alloc_hooks_free(const void *context, void *mem) {
+    icu_alloc_header *header;
+    (void)context;
+    if (mem == NULL) {
+        return;
+    }
+    header = (icu_alloc_header *)mem - 1;
+    ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.frees, 1);
+    icu_alloc_hooks_track(-(int64_t)header->h.size);
+    icu_alloc_hooks_release(header);
+}
+
+static void *U_CALLCONV icu_alloc_hooks_realloc(const void *context, void *mem, size_t size) {
+    icu_alloc_header *header, *moved;
+    size_t old_size;
+
+    if (mem == NULL) {
+        return icu_alloc_hooks_malloc(context, size);
+    }
+    if (size == 0) {
+        icu_alloc_hooks_free(context, mem);
+        return NULL;
+    }
+
+    header = (icu_alloc_header *)mem - 1;
+    old_size = header->h.size;
+    if (header->h.size_class == 0) {
+        moved = (icu_alloc_header *)realloc(header, sizeof(icu_alloc_header) + size);
+        if (moved == NULL) {
+            return NULL;
+        }
+        moved->h.size = size;
+    } else if (size <= header->h.size_class * ICU_ALLOC_HOOKS_CLASS_SIZE) {
+        /* still fits in its size class */
+        moved = header;
+        moved->h.size = size;
+    } else {
+        moved = icu_alloc_hooks_block(size);
+        if (moved == NULL) {
+            return NULL;
+        }
+        memcpy(moved + 1, mem, old_size);
+        icu_alloc_hooks_release(header);
+    }
+
+    ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.reallocs, 1);
+    ICU_ALLOC_HOOKS_ADD(&icu_alloc_hooks_counters.bytes, (int64_t)size);
+    icu_alloc_hooks_track((int64_t)size - (int64_t)old_size);
+    return moved + 1;
+}
+
+UBool icu_alloc_hooks_install(icu_alloc_strategy strategy, UErrorCode *status) {
+    if (U_FAILURE(*status)) {
+        return 0;
+    }
+    icu_alloc_hooks_strategy = strategy;
+    u_setMemoryFunctions(NULL, icu_alloc_hooks_malloc, icu_alloc_hooks_realloc, icu_alloc_hooks_free, status);
+    return U_SUCCESS(*status);
+}
+
+void icu_alloc_hooks_stats(icu_alloc_stats *stats) {
+    stats->allocs = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.allocs);
+    stats->reallocs = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.reallocs);
+    stats->frees = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.frees);
+    stats->bytes = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.bytes);
+    stats->current = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.current);
+    stats->peak = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.peak);
+    stats->pool_hits = ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.pool_hits);
+}
+
+void icu_alloc_hooks_reset(void) {
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.allocs, 0);
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.reallocs, 0);
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.frees, 0);
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.bytes, 0);
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.pool_hits, 0);
+    ICU_ALLOC_HOOKS_STORE(&icu_alloc_hooks_counters.peak, ICU_ALLOC_HOOKS_LOAD(&icu_alloc_hooks_counters.current));
+}
+
+#endif /* ICU_ALLOC_HOOKS_IMPLEMENTATION */
+
+#endif /* ICU_ALLOC_HOOKS_H */
@@ -0,0 +1,148 @@
+/*
+ * Header-only helper shipped with the conan ICU package (option with_data_loader).
+ *
+ * Maps the ICU data archive (data_packaging=archive) once and hands it to ICU
+ * with udata_setCommonData(), optionally pre-faulting the pages so the first
+ * ucnv_open()/ucol_open() doesn't pay for the page faults. Call it before any
+ * other ICU function:
+ *
+ *     UErrorCode status = U_ZERO_ERROR;
+ *     icu_data_loader_init(NULL, 1, &status);
+ *
+ * With path == NULL the archive is looked up in $ICU_DATA (exported by the
+ * package) and then in CONAN_ICU_DATA_DIR (a define exported by the package).
+ * The mapping is kept for the lifetime of the process.
+ */
+
+#ifndef ICU_DATA_LOADER_H
+#define ICU_DATA_LOADER_H
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "unicode/utypes.h"
+#include "unicode/udata.h"
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+#ifndef ICU_DATA_LOADER_PATH_MAX
+#define ICU_DATA_LOADER_PATH_MAX 4096
+#endif
+
+/* Writes the default archive path (<ICU_DATA or CONAN_ICU_DATA_DIR>/icudt<version><endianness>.dat) */
+static inline UBool icu_data_loader_default_path(char *path, size_t capacity) {
+    const char *dir = getenv("ICU_DATA");
+#ifdef CONAN_ICU_DATA_DIR
+    if (dir == NULL || *dir == 0) {
+        dir = CONAN_ICU_DATA_DIR;
+    }
+#endif
+    if (dir == NULL || *dir == 0) {
+        return 0;
+    }
+    return snprintf(path, capacity, "%s/%s.dat", dir, U_ICUDATA_NAME) < (int)capacity;
+}
+
+/* Reads one byte per page so the whole archive is resident */
+static inline void icu_data_loader_prefault(const void *data, size_t size) {
+    const volatile unsigned char *bytes = (const volatile unsigned char *)data;
+    unsigned char sum = 0;
+    size_t offset;
+    for (offset = 0; offset < size; offset += 4096) {
+        sum ^= bytes[offset];
+    }
+    (void)sum;
+}
+
+/* Maps `path` read-only, returns NULL on failure */
+static inline const void *icu_data_loader_map(const char *path, UBool prefault, size_t *size) {
+    const void *data = NULL;
+#ifdef _WIN32
+    HANDLE file, mapping;
+    LARGE_INTEGER file_size;
+
+    file = CreateFileA(path, GENERIC_READ, FILE_SHARE_READ, NULL, OPEN_EXISTING,
+                       FILE_ATTRIBUTE_NORMAL | FILE_FLAG_RANDOM_ACCESS, NULL);
+    if (file == INVALID_HANDLE_VALUE) {
+        return NULL;
+    }
+    if (!GetFileSizeEx(file, &file_size)) {
+        CloseHandle(file);
+        return NULL;
+    }
+    mapping = CreateFileMappingA(file, NULL, PAGE_READONLY, 0, 0, NULL);
+    CloseHandle(file);
+    if (mapping == NULL) {
+        return NULL;
+    }
+    data = MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0);
+    /* the view keeps the mapping alive */
+    CloseHandle(mapping);
+    *size = (size_t)file_size.QuadPart;
+#else
+    struct stat st;
+    void *mapped;
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
+        return NULL;
+    }
+    if (fstat(fd, &st) != 0 || st.st_size <= 0) {
+        close(fd);
+        return NULL;
+    }
+    mapped = mmap(NULL, (size_t)st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (mapped == MAP_FAILED) {
+        return NULL;
+    }
+    if (prefault) {
+        madvise(mapped, (size_t)st.st_size, MADV_WILLNEED);
+    }
+    data = mapped;
+    *size = (size_t)st.st_size;
+#endif
+    if (data != NULL && prefault) {
+        icu_data_loader_prefault(data, *size);
+    }
+    return data;
+}
+
+/*
+ * Maps the archive and registers it as ICU's common data.
+ * Returns non-zero on success; on failure *status is set and ICU keeps its default lookup.
+ */
+static inline UBool icu_data_loader_init(const char *path, UBool prefault, UErrorCode *status) {
+    char default_path[ICU_DATA_LOADER_PATH_MAX];
+    const void *data;
+    size_t size = 0;
+
+    if (U_FAILURE(*status)) {
+        return 0;
+    }
+    if (path == NULL) {
+        if (!icu_data_loader_default_path(default_path, sizeof(default_path))) {
+            *status = U_FILE_ACCESS_ERROR;
+            return 0;
+        }
+        path = default_path;
+    }
+
+    data = icu_data_loader_map(path, prefault, &size);
+    if (data == NULL) {
+        *status = U_FILE_ACCESS_ERROR;
+        return 0;
+    }
+
+    udata_setCommonData(data, status);
+    return U_SUCCESS(*status);
+}
+
+#endif /* ICU_DATA_LOADER_H */
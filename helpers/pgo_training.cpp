@@ -0,0 +1,144 @@
+// Training workload for with_pgo=True: run against the instrumented ICU build
+// so the profile covers the paths our services spend their time in
+// (conversion, normalization, case folding, collation and break iteration).
+
+#include <stdio.h>
+#include <string>
+#include <vector>
+
+#include "unicode/ubrk.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/unorm2.h"
+#include "unicode/ustring.h"
+
+static const char *const samples[] = {
+    u8"The quick brown fox jumps over the lazy dog, 1234567890 times.",
+    u8"François a reçu 42 € pour le café crème et la crêpe brûlée.",
+    u8"Straße, Grüße aus München: Äpfel, Öl und Übergrößen.",
+    u8"Ξεσκεπάζω τὴν ψυχοφθόρα βδελυγμία.",
+    u8"Съешь же ещё этих мягких французских булок.",
+    u8"日本語のテキストを処理します。漢字とひらがな。",
+    u8"中文分词和排序测试，包括繁體字。",
+    u8"Combining: é à ô ñ, ligatures ﬁ ﬂ, fullwidth ＡＢＣ.",
+    u8"Supplementary: \U0001F600 \U0001D400\U0001D401 \U00020000 and math ∑√∞.",
+    u8"ISTANBUL İstanbul ışık, Dz ǅ ǆ, ẞ ß."
+};
+
+static const char *const converters[] = { "UTF-8", "windows-1252", "ISO-8859-1", "UTF-16LE", "Shift_JIS", "GB18030" };
+static const char *const locales[] = { "en", "de", "fr", "ru", "ja", "zh" };
+
+static int failures = 0;
+
+static void check(UErrorCode status, const char *what) {
+    if (U_FAILURE(status)) {
+        // a trimmed data build may lack some converters/locales, train on the rest
+        ++failures;
+        fprintf(stderr, "pgo_training: %s: %s\n", what, u_errorName(status));
+    }
+}
+
+int main() {
+    const int rounds = 10000;
+    const size_t nsamples = sizeof(samples) / sizeof(samples[0]);
+
+    std::vector<std::vector<UChar> > text(nsamples);
+    for (size_t i = 0; i < nsamples; ++i) {
+        UErrorCode status = U_ZERO_ERROR;
+        int32_t length = 0;
+        text[i].resize(256);
+        u_strFromUTF8(text[i].data(), (int32_t)text[i].size(), &length, samples[i], -1, &status);
+        check(status, "u_strFromUTF8");
+        text[i].resize(U_SUCCESS(status) ? length : 0);
+    }
+
+    std::vector<UChar> buffer(1024);
+    std::vector<char> bytes(2048);
+    std::vector<uint8_t> key(2048);
+
+    // conversion round trips
+    for (size_t c = 0; c < sizeof(converters) / sizeof(converters[0]); ++c) {
+        UErrorCode status = U_ZERO_ERROR;
+        UConverter *cnv = ucnv_open(converters[c], &status);
+        check(status, converters[c]);
+        if (U_FAILURE(status)) {
+            continue;
+        }
+        for (int r = 0; r < rounds; ++r) {
+            for (size_t i = 0; i < nsamples; ++i) {
+                UErrorCode s = U_ZERO_ERROR;
+                int32_t length = ucnv_fromUChars(cnv, bytes.data(), (int32_t)bytes.size(),
+                                                 text[i].data(), (int32_t)text[i].size(), &s);
+                s = U_ZERO_ERROR;
+                ucnv_toUChars(cnv, buffer.data(), (int32_t)buffer.size(), bytes.data(), length, &s);
+            }
+        }
+        ucnv_close(cnv);
+    }
+
+    // normalization and case folding
+    UErrorCode status = U_ZERO_ERROR;
+    const UNormalizer2 *norms[] = { unorm2_getNFCInstance(&status), unorm2_getNFDInstance(&status),
+                                    unorm2_getNFKCInstance(&status), unorm2_getNFKCCasefoldInstance(&status) };
+    check(status, "unorm2_get*Instance");
+    if (U_SUCCESS(status)) {
+        for (int r = 0; r < rounds; ++r) {
+            for (size_t i = 0; i < nsamples; ++i) {
+                for (size_t n = 0; n < sizeof(norms) / sizeof(norms[0]); ++n) {
+                    UErrorCode s = U_ZERO_ERROR;
+                    unorm2_normalize(norms[n], text[i].data(), (int32_t)text[i].size(),
+                                     buffer.data(), (int32_t)buffer.size(), &s);
+                    s = U_ZERO_ERROR;
+                    unorm2_isNormalized(norms[n], text[i].data(), (int32_t)text[i].size(), &s);
+                }
+                UErrorCode s = U_ZERO_ERROR;
+                u_strFoldCase(buffer.data(), (int32_t)buffer.size(), text[i].data(), (int32_t)text[i].size(),
+                              U_FOLD_CASE_DEFAULT, &s);
+            }
+        }
+    }
+
+    // collation and break iteration per locale
+    for (size_t l = 0; l < sizeof(locales) / sizeof(locales[0]); ++l) {
+        UErrorCode s = U_ZERO_ERROR;
+#if !UCONFIG_NO_COLLATION
+        UCollator *coll = ucol_open(locales[l], &s);
+        check(s, "ucol_open");
+        if (U_SUCCESS(s)) {
+            for (int r = 0; r < rounds; ++r) {
+                for (size_t i = 0; i < nsamples; ++i) {
+                    ucol_getSortKey(coll, text[i].data(), (int32_t)text[i].size(), key.data(), (int32_t)key.size());
+                    const std::vector<UChar> &other = text[(i + 1) % nsamples];
+                    ucol_strcoll(coll, text[i].data(), (int32_t)text[i].size(), other.data(), (int32_t)other.size());
+                }
+            }
+            ucol_close(coll);
+        }
+#endif
+
+#if !UCONFIG_NO_BREAK_ITERATION
+        const UBreakIteratorType types[] = { UBRK_CHARACTER, UBRK_WORD, UBRK_LINE, UBRK_SENTENCE };
+        for (size_t t = 0; t < sizeof(types) / sizeof(types[0]); ++t) {
+            s = U_ZERO_ERROR;
+            UBreakIterator *brk = ubrk_open(types[t], locales[l], NULL, 0, &s);
+            check(s, "ubrk_open");
+            if (U_FAILURE(s)) {
+                continue;
+            }
+            for (int r = 0; r < rounds / 10; ++r) {
+                for (size_t i = 0; i < nsamples; ++i) {
+                    UErrorCode ts = U_ZERO_ERROR;
+                    ubrk_setText(brk, text[i].data(), (int32_t)text[i].size(), &ts);
+                    while (ubrk_next(brk) != UBRK_DONE) {
+                    }
+                }
+            }
+            ubrk_close(brk);
+        }
+#endif
+        (void)s;
+    }
+
+    printf("pgo_training: done (%d failures)\n", failures);
+    return 0;
+}
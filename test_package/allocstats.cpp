@@ -0,0 +1,156 @@
+// Counts ICU's heap allocations per operation through the packaged allocation
+// hooks (with_alloc_hooks=True) for converter opening, collation and
+// normalization, and times each workload with the malloc or the pool strategy.
+// Writes one JSON object per workload and line.
+//
+//    allocstats [--pool] [--iterations <n>] [--output <file.jsonl>]
+
+#include "bench_common.h"
+
+#define ICU_ALLOC_HOOKS_IMPLEMENTATION
+#include "icu_alloc_hooks.h"
+
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/unistr.h"
+#include "unicode/normalizer2.h"
+
+namespace {
+
+struct Workload {
+    std::string name;
+    double seconds;
+    int iterations;
+    icu_alloc_stats stats;
+    std::string error;
+};
+
+// Runs `op` `iterations` times between a counter reset and a snapshot
+template<typename Op>
+Workload measure(const char *name, int iterations, Op op) {
+    Workload workload;
+    workload.name = name;
+    workload.iterations = iterations;
+    icu_alloc_hooks_reset();
+    double start = bench::now();
+    for (int i = 0; i < iterations && workload.error.empty(); ++i) {
+        op(workload.error);
+    }
+    workload.seconds = bench::now() - start;
+    icu_alloc_hooks_stats(&workload.stats);
+    return workload;
+}
+
+void print_workload(FILE *out, const char *strategy, const Workload &w) {
+    double n = w.iterations > 0 ? w.iterations : 1;
+    fprintf(out, "{\"suite\": \"allocations\", \"icu_version\": \"%s\", \"strategy\": \"%s\", \"name\": \"%s\", "
+                 "\"iterations\": %d, \"seconds\": %.6f, \"allocs_per_op\": %.2f, \"reallocs_per_op\": %.2f, "
+                 "\"bytes_per_op\": %.1f, \"peak_bytes\": %lld, \"pool_hits\": %lld, \"error\": \"%s\"}\n",
+            U_ICU_VERSION, strategy, w.name.c_str(), w.iterations, w.seconds, w.stats.allocs / n,
+            w.stats.reallocs / n, w.stats.bytes / n, (long long)w.stats.peak, (long long)w.stats.pool_hits,
+            bench::json_escape(w.error).c_str());
+}
+
+} // namespace
+
+int main(int argc, const char *argv[]) {
+    icu_alloc_strategy strategy = ICU_ALLOC_MALLOC;
+    int iterations = 1000;
+    const char *output = NULL;
+
+    for (int i = 1; i < argc; ++i) {
+        if (!strcmp(argv[i], "--pool")) {
+            strategy = ICU_ALLOC_POOL;
+        } else if (!strcmp(argv[i], "--iterations") && i + 1 < argc) {
+            iterations = atoi(argv[++i]);
+        } else if (!strcmp(argv[i], "--output") && i + 1 < argc) {
+            output = argv[++i];
+        } else {
+            fprintf(stderr, "usage: %s [--pool] [--iterations <n>] [--output <file.jsonl>]\n", argv[0]);
+            return 2;
+        }
+    }
+
+    // must come first, ICU can't change its allocator once it has allocated memory
+    UErrorCode status = U_ZERO_ERROR;
+    if (!icu_alloc_hooks_install(strategy, &status)) {
+        fprintf(stderr, "icu_alloc_hooks_install: %s\n", u_errorName(status));
+        return 1;
+    }
+
+    const std::vector<std::string> &lines = bench::sample_lines();
+    std::vector<icu::UnicodeString> texts;
+    for (size_t i = 0; i < lines.size(); ++i) {
+        texts.push_back(icu::UnicodeString::fromUTF8(lines[i]));
+    }
+
+    std::vector<Workload> workloads;
+
+    // the first open loads and caches the converter data, later ones only allocate the UConverter
+#if !UCONFIG_NO_LEGACY_CONVERSION
+    const char *converter = "windows-1252";
+#else
+    const char *converter = "UTF-8";
+#endif
+    workloads.push_back(measure("ucnv_open_first", 1, [&](std::string &error) {
+        UErrorCode s = U_ZERO_ERROR;
+        UConverter *cnv = ucnv_open(converter, &s);
+        if (U_FAILURE(s)) {
+            error = u_errorName(s);
+        }
+        ucnv_close(cnv);
+    }));
+    workloads.push_back(measure("ucnv_open", iterations, [&](std::string &error) {
+        UErrorCode s = U_ZERO_ERROR;
+        UConverter *cnv = ucnv_open(converter, &s);
+        if (U_FAILURE(s)) {
+            error = u_errorName(s);
+        }
+        ucnv_close(cnv);
+    }));
+
+#if !UCONFIG_NO_COLLATION
+    workloads.push_back(measure("ucol_open_strcoll", iterations, [&](std::string &error) {
+        UErrorCode s = U_ZERO_ERROR;
+        UCollator *coll = ucol_open("de", &s);
+        if (U_FAILURE(s)) {
+            error = u_errorName(s);
+            return;
+        }
+        for (size_t i = 0; i + 1 < texts.size(); ++i) {
+            ucol_strcoll(coll, texts[i].getBuffer(), texts[i].length(), texts[i + 1].getBuffer(), texts[i + 1].length());
+        }
+        ucol_close(coll);
+    }));
+#endif
+
+    workloads.push_back(measure("normalize_nfkc_casefold", iterations, [&](std::string &error) {
+        UErrorCode s = U_ZERO_ERROR;
+        const icu::Normalizer2 *norm2 = icu::Normalizer2::getNFKCCasefoldInstance(s);
+        for (size_t i = 0; i < texts.size() && U_SUCCESS(s); ++i) {
+            icu::UnicodeString normalized = norm2->normalize(texts[i], s);
+        }
+        if (U_FAILURE(s)) {
+            error = u_errorName(s);
+        }
+    }));
+
+    FILE *out = output ? fopen(output, "a") : NULL;
+    if (output && !out) {
+        fprintf(stderr, "cannot write %s\n", output);
+        return 1;
+    }
+    bool failed = false;
+    const char *strategy_name = strategy == ICU_ALLOC_POOL ? "pool" : "malloc";
+    for (size_t i = 0; i < workloads.size(); ++i) {
+        print_workload(stdout, strategy_name, workloads[i]);
+        if (out) {
+            print_workload(out, strategy_name, workloads[i]);
+        }
+        failed = failed || !workloads[i].error.empty();
+    }
+    if (out) {
+        fclose(out);
+    }
+    return failed ? 1 : 0;
+}
@@ -0,0 +1,159 @@
+// Helpers shared by the test_package benchmarks: timing, corpus generation
+// and JSON reporting.
+
+#ifndef ICU_TEST_PACKAGE_BENCH_COMMON_H
+#define ICU_TEST_PACKAGE_BENCH_COMMON_H
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "unicode/utypes.h"
+#include "unicode/uvernum.h"
+#include "unicode/ustring.h"
+
+namespace bench {
+
+// monotonic wall clock in seconds
+inline double now() {
+    return std::chrono::duration<double>(std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+
+struct Result {
+    std::string name;
+    double seconds;    // best pass
+    double ops;        // operations per pass (lines, sort keys, boundaries...)
+    double bytes;      // UTF-8 bytes processed per pass
+    std::string error; // set when the benchmark could not run (e.g. missing data)
+
+    Result(const std::string &n) : name(n), seconds(0), ops(0), bytes(0) {}
+};
+
+// A few lines per script so that conversion, normalization, case folding,
+// collation and break iteration see ASCII, Latin, Greek, Cyrillic, CJK,
+// combining marks and supplementary characters.
+inline const std::vector<std::string> &sample_lines() {
+    static const std::vector<std::string> lines = {
+        u8"The quick brown fox jumps over the lazy dog, 1234567890 times.",
+        u8"François a reçu 42 € pour le café crème et la crêpe brûlée.",
+        u8"Straße, Grüße aus München: Äpfel, Öl und Übergrößen.",
+        u8"Ξεσκεπάζω τὴν ψυχοφθόρα βδελυγμία.",
+        u8"Съешь же ещё этих мягких французских булок.",
+        u8"日本語のテキストを処理します。漢字とひらがな。",
+        u8"中文分词和排序测试，包括繁體字。",
+        u8"Combining: é à ô ñ, ligatures ﬁ ﬂ, fullwidth ＡＢＣ.",
+        u8"Supplementary: \U0001F600 \U0001D400\U0001D401 \U00020000 and math ∑√∞.",
+        u8"ISTANBUL İstanbul ışık, Dz ǅ ǆ, ẞ ß."
+    };
+    return lines;
+}
+
+// Lines of sample text totalling at least `bytes` UTF-8 bytes
+inline std::vector<std::string> make_corpus(size_t bytes) {
+    const std::vector<std::string> &samples = sample_lines();
+    std::vector<std::string> corpus;
+    size_t total = 0;
+    unsigned int seed = 12345;
+    while (total < bytes) {
+        // a cheap LCG keeps the line order varied but reproducible
+        seed = seed * 1103515245u + 12345u;
+        const std::string &line = samples[(seed >> 16) % samples.size()];
+        corpus.push_back(line + " #" + std::to_string(corpus.size()));
+        total += corpus.back().size();
+    }
+    return corpus;
+}
+
+inline size_t corpus_bytes(const std::vector<std::string> &corpus) {
+    size_t total = 0;
+    for (size_t i = 0; i < corpus.size(); ++i) {
+        total += corpus[i].size();
+    }
+    return total;
+}
+
+// UTF-16 copies of the corpus lines (u_strFromUTF8, no converter involved)
+inline std::vector<std::vector<UChar> > to_utf16(const std::vector<std::string> &corpus) {
+    std::vector<std::vector<UChar> > lines(corpus.size());
+    for (size_t i = 0; i < corpus.size(); ++i) {
+        UErrorCode errorCode = U_ZERO_ERROR;
+        int32_t length = 0;
+        lines[i].resize(corpus[i].size() + 1);
+        u_strFromUTF8(lines[i].data(), (int32_t)lines[i].size(), &length,
+                      corpus[i].data(), (int32_t)corpus[i].size(), &errorCode);
+        lines[i].resize(U_SUCCESS(errorCode) ? length : 0);
+    }
+    return lines;
+}
+
+inline std::string json_escape(const std::string &s) {
+    std::string out;
+    for (size_t i = 0; i < s.size(); ++i) {
+        if (s[i] == '"' || s[i] == '\\') {
+            out += '\\';
+        }
+        out += s[i];
+    }
+    return out;
+}
+
+inline void print_result_json(FILE *out, const Result &r, bool last) {
+    if (!r.error.empty()) {
+        fprintf(out, "    {\"name\": \"%s\", \"error\": \"%s\"}%s\n",
+                r.name.c_str(), json_escape(r.error).c_str(), last ? "" : ",");
+        return;
+    }
+    double seconds = r.seconds > 0 ? r.seconds : 1e-9;
+    fprintf(out, "    {\"name\": \"%s\", \"seconds\": %.6f, \"ops\": %.0f, \"ops_per_sec\": %.1f, \"mb_per_sec\": %.2f}%s\n",
+            r.name.c_str(), r.seconds, r.ops, r.ops / seconds, r.bytes / seconds / (1024.0 * 1024.0),
+            last ? "" : ",");
+}
+
+inline void print_json(FILE *out, const char *suite, size_t corpusBytes, int passes,
+                       const std::vector<Result> &results) {
+    fprintf(out, "{\n  \"suite\": \"%s\",\n  \"icu_version\": \"%s\",\n  \"corpus_bytes\": %lu,\n  \"passes\": %d,\n  \"results\": [\n",
+            suite, U_ICU_VERSION, (unsigned long)corpusBytes, passes);
+    for (size_t i = 0; i < results.size(); ++i) {
+        print_result_json(out, results[i], i + 1 == results.size());
+    }
+    fprintf(out, "  ]\n}\n");
+}
+
+// Common command line: --size <MB> --passes <n> --threads <n> --output <file.json>
+struct Options {
+    double sizeMB;
+    int passes;
+    int threads; // highest thread count of the scaling benchmark
+    const char *output;
+
+    Options() : sizeMB(4), passes(3), threads((int)std::thread::hardware_concurrency()), output(NULL) {
+        if (threads < 1) {
+            threads = 1;
+        }
+    }
+
+    bool parse(int argc, const char *argv[]) {
+        for (int i = 1; i < argc; ++i) {
+            if (!strcmp(argv[i], "--size") && i + 1 < argc) {
+                sizeMB = atof(argv[++i]);
+            } else if (!strcmp(argv[i], "--passes") && i + 1 < argc) {
+                passes = atoi(argv[++i]);
+            } else if (!strcmp(argv[i], "--threads") && i + 1 < argc) {
+                threads = atoi(argv[++i]);
+            } else if (!strcmp(argv[i], "--output") && i + 1 < argc) {
+                output = argv[++i];
+            } else {
+                return false;
+            }
+        }
+        return sizeMB > 0 && passes > 0 && threads > 0;
+    }
+};
+
+} // namespace bench
+
+#endif // ICU_TEST_PACKAGE_BENCH_COMMON_H
@@ -0,0 +1,237 @@
+// Throughput benchmark for the ICU paths we use most: UTF-8 <-> UTF-16
+// conversion, normalization, case folding, collation sort keys and break
+// iteration over a generated multilingual corpus. Results are printed as JSON.
+//
+//    benchmark [--size <MB>] [--passes <n>] [--output <file.json>]
+
+#include "bench_common.h"
+
+#include "unicode/ubrk.h"
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/unorm2.h"
+#include "unicode/ustring.h"
+
+using bench::Result;
+
+namespace {
+
+typedef std::vector<std::string> Corpus;
+typedef std::vector<std::vector<UChar> > Corpus16;
+
+// Runs `pass` `passes` times and keeps the fastest one
+template<typename Pass>
+bool best_of(int passes, Result &result, Pass pass) {
+    for (int i = 0; i < passes; ++i) {
+        double start = bench::now();
+        if (!pass()) {
+            return false;
+        }
+        double elapsed = bench::now() - start;
+        if (i == 0 || elapsed < result.seconds) {
+            result.seconds = elapsed;
+        }
+    }
+    return true;
+}
+
+Result bench_utf8_to_utf16(const Corpus &corpus, int passes) {
+    Result result("ucnv_utf8_to_utf16");
+    UErrorCode errorCode = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open("UTF-8", &errorCode);
+    if (U_FAILURE(errorCode)) {
+        result.error = u_errorName(errorCode);
+        return result;
+    }
+    std::vector<UChar> buffer(1024);
+    best_of(passes, result, [&]() -> bool {
+        for (size_t i = 0; i < corpus.size(); ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            ucnv_toUChars(cnv, buffer.data(), (int32_t)buffer.size(),
+                          corpus[i].data(), (int32_t)corpus[i].size(), &status);
+            if (U_FAILURE(status)) {
+                result.error = u_errorName(status);
+                return false;
+            }
+        }
+        return true;
+    });
+    ucnv_close(cnv);
+    result.ops = (double)corpus.size();
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+
+Result bench_utf16_to_utf8(const Corpus &corpus, const Corpus16 &corpus16, int passes) {
+    Result result("ucnv_utf16_to_utf8");
+    UErrorCode errorCode = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open("UTF-8", &errorCode);
+    if (U_FAILURE(errorCode)) {
+        result.error = u_errorName(errorCode);
+        return result;
+    }
+    std::vector<char> buffer(4096);
+    best_of(passes, result, [&]() -> bool {
+        for (size_t i = 0; i < corpus16.size(); ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            ucnv_fromUChars(cnv, buffer.data(), (int32_t)buffer.size(),
+                            corpus16[i].data(), (int32_t)corpus16[i].size(), &status);
+            if (U_FAILURE(status)) {
+                result.error = u_errorName(status);
+                return false;
+            }
+        }
+        return true;
+    });
+    ucnv_close(cnv);
+    result.ops = (double)corpus16.size();
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+
+Result bench_normalize(const char *name, const UNormalizer2 *(*instance)(UErrorCode *),
+                       const Corpus &corpus, const Corpus16 &corpus16, int passes) {
+    Result result(name);
+    UErrorCode errorCode = U_ZERO_ERROR;
+    const UNormalizer2 *norm2 = instance(&errorCode);
+    if (U_FAILURE(errorCode)) {
+        result.error = u_errorName(errorCode);
+        return result;
+    }
+    std::vector<UChar> buffer(2048);
+    best_of(passes, result, [&]() -> bool {
+        for (size_t i = 0; i < corpus16.size(); ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            unorm2_normalize(norm2, corpus16[i].data(), (int32_t)corpus16[i].size(),
+                             buffer.data(), (int32_t)buffer.size(), &status);
+            if (U_FAILURE(status)) {
+                result.error = u_errorName(status);
+                return false;
+            }
+        }
+        return true;
+    });
+    result.ops = (double)corpus16.size();
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+
+Result bench_fold_case(const Corpus &corpus, const Corpus16 &corpus16, int passes) {
+    Result result("u_strFoldCase");
+    std::vector<UChar> buffer(2048);
+    best_of(passes, result, [&]() -> bool {
+        for (size_t i = 0; i < corpus16.size(); ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            u_strFoldCase(buffer.data(), (int32_t)buffer.size(),
+                          corpus16[i].data(), (int32_t)corpus16[i].size(), U_FOLD_CASE_DEFAULT, &status);
+            if (U_FAILURE(status)) {
+                result.error = u_errorName(status);
+                return false;
+            }
+        }
+        return true;
+    });
+    result.ops = (double)corpus16.size();
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+
+#if !UCONFIG_NO_COLLATION
+Result bench_sort_keys(const Corpus &corpus, const Corpus16 &corpus16, int passes) {
+    Result result("ucol_getSortKey");
+    UErrorCode errorCode = U_ZERO_ERROR;
+    UCollator *coll = ucol_open("en", &errorCode);
+    if (U_FAILURE(errorCode)) {
+        result.error = u_errorName(errorCode);
+        return result;
+    }
+    std::vector<uint8_t> key(4096);
+    best_of(passes, result, [&]() -> bool {
+        for (size_t i = 0; i < corpus16.size(); ++i) {
+            ucol_getSortKey(coll, corpus16[i].data(), (int32_t)corpus16[i].size(),
+                            key.data(), (int32_t)key.size());
+        }
+        return true;
+    });
+    ucol_close(coll);
+    result.ops = (double)corpus16.size();
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+#endif
+
+#if !UCONFIG_NO_BREAK_ITERATION
+Result bench_word_breaks(const Corpus &corpus, const Corpus16 &corpus16, int passes) {
+    Result result("ubrk_word");
+    UErrorCode errorCode = U_ZERO_ERROR;
+    UBreakIterator *brk = ubrk_open(UBRK_WORD, "en", NULL, 0, &errorCode);
+    if (U_FAILURE(errorCode)) {
+        result.error = u_errorName(errorCode);
+        return result;
+    }
+    double boundaries = 0;
+    best_of(passes, result, [&]() -> bool {
+        boundaries = 0;
+        for (size_t i = 0; i < corpus16.size(); ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            ubrk_setText(brk, corpus16[i].data(), (int32_t)corpus16[i].size(), &status);
+            if (U_FAILURE(status)) {
+                result.error = u_errorName(status);
+                return false;
+            }
+            while (ubrk_next(brk) != UBRK_DONE) {
+                ++boundaries;
+            }
+        }
+        return true;
+    });
+    ubrk_close(brk);
+    result.ops = boundaries;
+    result.bytes = (double)bench::corpus_bytes(corpus);
+    return result;
+}
+#endif
+
+} // namespace
+
+int main(int argc, const char *argv[]) {
+    bench::Options options;
+    if (!options.parse(argc, argv)) {
+        fprintf(stderr, "usage: %s [--size <MB>] [--passes <n>] [--output <file.json>]\n", argv[0]);
+        return 2;
+    }
+
+    Corpus corpus = bench::make_corpus((size_t)(options.sizeMB * 1024 * 1024));
+    Corpus16 corpus16 = bench::to_utf16(corpus);
+
+    std::vector<Result> results;
+    results.push_back(bench_utf8_to_utf16(corpus, options.passes));
+    results.push_back(bench_utf16_to_utf8(corpus, corpus16, options.passes));
+    results.push_back(bench_normalize("unorm2_nfc", unorm2_getNFCInstance, corpus, corpus16, options.passes));
+    results.push_back(bench_normalize("unorm2_nfkc", unorm2_getNFKCInstance, corpus, corpus16, options.passes));
+    results.push_back(bench_fold_case(corpus, corpus16, options.passes));
+#if !UCONFIG_NO_COLLATION
+    results.push_back(bench_sort_keys(corpus, corpus16, options.passes));
+#endif
+#if !UCONFIG_NO_BREAK_ITERATION
+    results.push_back(bench_word_breaks(corpus, corpus16, options.passes));
+#endif
+
+    bench::print_json(stdout, "throughput", bench::corpus_bytes(corpus), options.passes, results);
+    if (options.output) {
+        FILE *out = fopen(options.output, "w");
+        if (!out) {
+            fprintf(stderr, "cannot write %s\n", options.output);
+            return 1;
+        }
+        bench::print_json(out, "throughput", bench::corpus_bytes(corpus), options.passes, results);
+        fclose(out);
+    }
+
+    for (size_t i = 0; i < results.size(); ++i) {
+        if (!results[i].error.empty()) {
+            return 1;
+        }
+    }
+    return 0;
+}
@@ -0,0 +1,98 @@
+// Measures the latency of the first ucnv_open()/ucol_open() in a fresh process,
+// i.e. the cost of locating and loading the ICU data for the package's
+// data_packaging mode. Run it once per process; the test runs it several times
+// per mode and writes one JSON object per line.
+//
+//    coldstart [--mode <data_packaging>] [--loader] [--prefault] [--output <file.jsonl>]
+
+#include "bench_common.h"
+
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+
+#ifdef HAVE_ICU_DATA_LOADER
+#include "icu_data_loader.h"
+#endif
+
+int main(int argc, const char *argv[]) {
+    const char *mode = "unknown";
+    const char *output = NULL;
+    bool loader = false;
+    bool prefault = false;
+
+    for (int i = 1; i < argc; ++i) {
+        if (!strcmp(argv[i], "--mode") && i + 1 < argc) {
+            mode = argv[++i];
+        } else if (!strcmp(argv[i], "--output") && i + 1 < argc) {
+            output = argv[++i];
+        } else if (!strcmp(argv[i], "--loader")) {
+            loader = true;
+        } else if (!strcmp(argv[i], "--prefault")) {
+            loader = prefault = true;
+        } else {
+            fprintf(stderr, "usage: %s [--mode <data_packaging>] [--loader] [--prefault] [--output <file.jsonl>]\n", argv[0]);
+            return 2;
+        }
+    }
+
+    std::string errors;
+    double start = bench::now();
+
+    if (loader) {
+#ifdef HAVE_ICU_DATA_LOADER
+        UErrorCode status = U_ZERO_ERROR;
+        if (!icu_data_loader_init(NULL, (UBool)prefault, &status)) {
+            errors += std::string("icu_data_loader_init: ") + u_errorName(status) + " ";
+        }
+#else
+        errors += "icu_data_loader.h not packaged (with_data_loader=False) ";
+#endif
+    }
+    double loaded = bench::now();
+
+    // a table based converter, so the data is needed (UTF-8 is algorithmic)
+#if !UCONFIG_NO_LEGACY_CONVERSION
+    const char *converter = "windows-1252";
+#else
+    const char *converter = "UTF-8";
+#endif
+    UErrorCode cnvStatus = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open(converter, &cnvStatus);
+    double cnvOpened = bench::now();
+    if (U_FAILURE(cnvStatus)) {
+        errors += std::string("ucnv_open: ") + u_errorName(cnvStatus) + " ";
+    }
+
+#if !UCONFIG_NO_COLLATION
+    UErrorCode collStatus = U_ZERO_ERROR;
+    UCollator *coll = ucol_open("de", &collStatus);
+    double collOpened = bench::now();
+    if (U_FAILURE(collStatus)) {
+        errors += std::string("ucol_open: ") + u_errorName(collStatus) + " ";
+    }
+    ucol_close(coll);
+#else
+    double collOpened = cnvOpened;
+#endif
+
+    ucnv_close(cnv);
+
+    char line[512];
+    snprintf(line, sizeof(line),
+             "{\"suite\": \"coldstart\", \"icu_version\": \"%s\", \"mode\": \"%s\", \"loader\": %s, \"prefault\": %s, "
+             "\"loader_ms\": %.3f, \"ucnv_open_ms\": %.3f, \"ucol_open_ms\": %.3f, \"total_ms\": %.3f, \"error\": \"%s\"}\n",
+             U_ICU_VERSION, bench::json_escape(mode).c_str(), loader ? "true" : "false", prefault ? "true" : "false",
+             (loaded - start) * 1000, (cnvOpened - loaded) * 1000, (collOpened - cnvOpened) * 1000,
+             (collOpened - start) * 1000, bench::json_escape(errors).c_str());
+    fputs(line, stdout);
+    if (output) {
+        FILE *out = fopen(output, "a");
+        if (!out) {
+            fprintf(stderr, "cannot write %s\n", output);
+            return 1;
+        }
+        fputs(line, out);
+        fclose(out);
+    }
+    return errors.empty() ? 0 : 1;
+}
@@ -10,6 +10,8 @@ class ICUTestConan(ConanFile):
     def build(self):
         cmake = CMake(self)
         cmake.verbose = True
+        # the i18n programs link icui18n and its dependencies, even when link_components leaves it out
+        cmake.definitions["ICU_I18N_LIBS"] = ";".join(self.deps_user_info["icu"].libs_i18n.split())
         cmake.configure()
         cmake.build()
 
@@ -25,3 +27,39 @@ class ICUTestConan(ConanFile):
         with tools.environment_append({"LD_LIBRARY_PATH": bin_dir, "DYLD_LIBRARY_PATH": bin_dir}):
             self.run(".{0}test_package".format(os.sep))
 
+            # with_alloc_hooks=True: allocations per operation with malloc and with the pool
+            if os.path.isfile(os.path.join(self.deps_cpp_info["icu"].rootpath, "include", "icu_alloc_hooks.h")):
+                if os.path.isfile("allocations.jsonl"):
+                    os.remove("allocations.jsonl")
+                for strategy in ("", "--pool"):
+                    self.run(".{0}allocstats {1} --output allocations.jsonl".format(os.sep, strategy))
+                self.output.info("Allocation counts: %s" % os.path.join(bin_dir, "allocations.jsonl"))
+
+            # profiling=True: frame pointers and unwind tables through ICU
+            if self.deps_user_info["icu"].profiling == "True" and self.settings.os != "Windows":
+                self.run(".{0}unwindcheck --verbose".format(os.sep))
+
+            # CONAN_ICU_BENCHMARK=1 (or the corpus size in MB) also runs the throughput benchmark
+            if os.environ.get("CONAN_ICU_BENCHMARK"):
+                size = os.environ["CONAN_ICU_BENCHMARK"] if os.environ["CONAN_ICU_BENCHMARK"] != "1" else "4"
+                self.run(".{0}benchmark --size {1} --output benchmark.json".format(os.sep, size))
+                self.output.info("Benchmark results: %s" % os.path.join(bin_dir, "benchmark.json"))
+
+                # CONAN_ICU_BENCHMARK_THREADS sets the highest thread count (default: all cores)
+                threads = os.environ.get("CONAN_ICU_BENCHMARK_THREADS")
+                self.run(".{0}scaling --size {1} {2} --output scaling.json".format(os.sep, size,
+                                                                                   "--threads %s" % threads if threads else ""))
+                self.output.info("Scaling results: %s" % os.path.join(bin_dir, "scaling.json"))
+
+                # each run is a fresh process, so it pays for locating and loading the data
+                mode = self.deps_user_info["icu"].data_packaging
+                if os.path.isfile("coldstart.jsonl"):
+                    os.remove("coldstart.jsonl")
+                variants = [""]
+                if mode == "archive" and os.path.isfile(os.path.join(self.deps_cpp_info["icu"].rootpath, "include", "icu_data_loader.h")):
+                    variants.extend(["--loader", "--prefault"])
+                for variant in variants:
+                    for _ in range(5):
+                        self.run(".{0}coldstart --mode {1} {2} --output coldstart.jsonl".format(os.sep, mode, variant))
+                self.output.info("Cold start results: %s" % os.path.join(bin_dir, "coldstart.jsonl"))
+
@@ -0,0 +1,254 @@
+// Multithreaded scaling benchmark: runs the same per-thread work from 1 up to
+// --threads threads and reports the throughput and scaling efficiency
+// (throughput / (threads * single thread throughput)) of paths going through
+// ICU's shared caches and locks: conversion with per-thread converters,
+// collation with cloned collators, ucnv_open/ucnv_close churn (converter
+// shared data cache) and Locale/NumberFormat creation (unified cache).
+//
+//    scaling [--size <MB>] [--passes <n>] [--threads <n>] [--output <file.json>]
+
+#include "bench_common.h"
+
+#include <atomic>
+#include <functional>
+
+#include "unicode/ucnv.h"
+#include "unicode/ucol.h"
+#include "unicode/locid.h"
+#include "unicode/numfmt.h"
+
+namespace {
+
+typedef std::vector<std::string> Corpus;
+typedef std::vector<std::vector<UChar> > Corpus16;
+
+// One thread's share of a workload: returns the number of operations done, or sets `error`
+typedef std::function<double(int thread, std::string &error)> Work;
+
+struct Point {
+    std::string name;
+    int threads;
+    double seconds; // best pass
+    double ops;     // operations of all threads per pass
+    std::string error;
+};
+
+// Starts `threads` threads together and keeps the fastest of `passes` runs
+Point run(const char *name, int threads, int passes, const Work &work) {
+    Point point = { name, threads, 0, 0, "" };
+    for (int pass = 0; pass < passes && point.error.empty(); ++pass) {
+        std::atomic<int> ready(0);
+        std::atomic<bool> go(false);
+        std::vector<double> ops(threads, 0);
+        std::vector<std::string> errors(threads);
+        std::vector<std::thread> pool;
+        for (int t = 0; t < threads; ++t) {
+            pool.push_back(std::thread([&, t]() {
+                ++ready;
+                while (!go) {
+                    std::this_thread::yield();
+                }
+                ops[t] = work(t, errors[t]);
+            }));
+        }
+        while (ready < threads) {
+            std::this_thread::yield();
+        }
+        double start = bench::now();
+        go = true;
+        for (int t = 0; t < threads; ++t) {
+            pool[t].join();
+        }
+        double elapsed = bench::now() - start;
+
+        double total = 0;
+        for (int t = 0; t < threads; ++t) {
+            total += ops[t];
+            if (!errors[t].empty()) {
+                point.error = errors[t];
+            }
+        }
+        if (pass == 0 || elapsed < point.seconds) {
+            point.seconds = elapsed;
+            point.ops = total;
+        }
+    }
+    return point;
+}
+
+// 1, 2, 4... up to and including `maxThreads`
+std::vector<int> thread_counts(int maxThreads) {
+    std::vector<int> counts;
+    for (int n = 1; n < maxThreads; n *= 2) {
+        counts.push_back(n);
+    }
+    counts.push_back(maxThreads);
+    return counts;
+}
+
+Work convert(const Corpus &corpus) {
+    return [&corpus](int, std::string &error) -> double {
+        UErrorCode status = U_ZERO_ERROR;
+        UConverter *cnv = ucnv_open("UTF-8", &status);
+        std::vector<UChar> buffer(1024);
+        for (size_t i = 0; i < corpus.size() && U_SUCCESS(status); ++i) {
+            ucnv_toUChars(cnv, buffer.data(), (int32_t)buffer.size(),
+                          corpus[i].data(), (int32_t)corpus[i].size(), &status);
+        }
+        ucnv_close(cnv);
+        if (U_FAILURE(status)) {
+            error = u_errorName(status);
+        }
+        return (double)corpus.size();
+    };
+}
+
+#if !UCONFIG_NO_COLLATION
+Work collate(const UCollator *coll, const Corpus16 &corpus16) {
+    return [coll, &corpus16](int, std::string &error) -> double {
+        UErrorCode status = U_ZERO_ERROR;
+#if U_ICU_VERSION_MAJOR_NUM >= 71
+        UCollator *clone = ucol_clone(coll, &status);
+#else
+        UCollator *clone = ucol_safeClone(coll, NULL, NULL, &status);
+#endif
+        if (U_FAILURE(status)) {
+            error = u_errorName(status);
+            return 0;
+        }
+        for (size_t i = 0; i + 1 < corpus16.size(); ++i) {
+            ucol_strcoll(clone, corpus16[i].data(), (int32_t)corpus16[i].size(),
+                         corpus16[i + 1].data(), (int32_t)corpus16[i + 1].size());
+        }
+        ucol_close(clone);
+        return (double)(corpus16.size() - 1);
+    };
+}
+#endif
+
+Work converter_churn(int opens) {
+    return [opens](int t, std::string &error) -> double {
+#if !UCONFIG_NO_LEGACY_CONVERSION
+        static const char *const names[] = { "windows-1252", "ISO-8859-1", "UTF-8", "UTF-16LE" };
+#else
+        static const char *const names[] = { "UTF-8", "UTF-16LE", "UTF-32", "US-ASCII" };
+#endif
+        for (int i = 0; i < opens; ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            UConverter *cnv = ucnv_open(names[(i + t) % 4], &status);
+            if (U_FAILURE(status)) {
+                error = u_errorName(status);
+                return i;
+            }
+            ucnv_close(cnv);
+        }
+        return opens;
+    };
+}
+
+#if !UCONFIG_NO_FORMATTING
+Work number_formats(int creations) {
+    return [creations](int t, std::string &error) -> double {
+        static const char *const locales[] = { "en_US", "de_DE", "fr_FR", "ja_JP" };
+        for (int i = 0; i < creations; ++i) {
+            UErrorCode status = U_ZERO_ERROR;
+            icu::Locale locale(locales[(i + t) % 4]);
+            icu::NumberFormat *format = icu::NumberFormat::createInstance(locale, status);
+            if (U_FAILURE(status)) {
+                error = u_errorName(status);
+                return i;
+            }
+            delete format;
+        }
+        return creations;
+    };
+}
+#endif
+
+void print_json(FILE *out, const bench::Options &options, size_t corpusBytes, const std::vector<Point> &points) {
+    fprintf(out, "{\n  \"suite\": \"scaling\",\n  \"icu_version\": \"%s\",\n  \"corpus_bytes\": %lu,\n  \"passes\": %d,\n"
+                 "  \"max_threads\": %d,\n  \"results\": [\n",
+            U_ICU_VERSION, (unsigned long)corpusBytes, options.passes, options.threads);
+    for (size_t i = 0; i < points.size(); ++i) {
+        const Point &p = points[i];
+        const char *separator = i + 1 == points.size() ? "" : ",";
+        if (!p.error.empty()) {
+            fprintf(out, "    {\"name\": \"%s\", \"threads\": %d, \"error\": \"%s\"}%s\n",
+                    p.name.c_str(), p.threads, bench::json_escape(p.error).c_str(), separator);
+            continue;
+        }
+        // the first point of each workload is its single thread run
+        size_t first = i;
+        while (first > 0 && points[first - 1].name == p.name) {
+            --first;
+        }
+        double throughput = p.ops / (p.seconds > 0 ? p.seconds : 1e-9);
+        double single = points[first].ops / (points[first].seconds > 0 ? points[first].seconds : 1e-9);
+        fprintf(out, "    {\"name\": \"%s\", \"threads\": %d, \"seconds\": %.6f, \"ops\": %.0f, \"ops_per_sec\": %.1f, "
+                     "\"efficiency\": %.3f}%s\n",
+                p.name.c_str(), p.threads, p.seconds, p.ops, throughput,
+                single > 0 ? throughput / (p.threads * single) : 0, separator);
+    }
+    fprintf(out, "  ]\n}\n");
+}
+
+} // namespace
+
+int main(int argc, const char *argv[]) {
+    bench::Options options;
+    if (!options.parse(argc, argv)) {
+        fprintf(stderr, "usage: %s [--size <MB>] [--passes <n>] [--threads <n>] [--output <file.json>]\n", argv[0]);
+        return 2;
+    }
+
+    Corpus corpus = bench::make_corpus((size_t)(options.sizeMB * 1024 * 1024));
+    Corpus16 corpus16 = bench::to_utf16(corpus);
+
+    std::vector<std::pair<const char *, Work> > workloads;
+    workloads.push_back(std::make_pair("ucnv_utf8_to_utf16", convert(corpus)));
+#if !UCONFIG_NO_COLLATION
+    UErrorCode status = U_ZERO_ERROR;
+    UCollator *coll = ucol_open("en", &status);
+    if (U_SUCCESS(status)) {
+        workloads.push_back(std::make_pair("ucol_strcoll_clone", collate(coll, corpus16)));
+    } else {
+        fprintf(stderr, "ucol_open: %s\n", u_errorName(status));
+    }
+#endif
+    workloads.push_back(std::make_pair("ucnv_open_close", converter_churn(20000)));
+#if !UCONFIG_NO_FORMATTING
+    workloads.push_back(std::make_pair("numberformat_create", number_formats(2000)));
+#endif
+
+    std::vector<Point> points;
+    std::vector<int> counts = thread_counts(options.threads);
+    for (size_t w = 0; w < workloads.size(); ++w) {
+        // untimed warm-up, so the single thread run doesn't pay for loading data into the caches
+        run(workloads[w].first, 1, 1, workloads[w].second);
+        for (size_t c = 0; c < counts.size(); ++c) {
+            points.push_back(run(workloads[w].first, counts[c], options.passes, workloads[w].second));
+        }
+    }
+
+#if !UCONFIG_NO_COLLATION
+    ucol_close(coll);
+#endif
+
+    print_json(stdout, options, bench::corpus_bytes(corpus), points);
+    if (options.output) {
+        FILE *out = fopen(options.output, "w");
+        if (!out) {
+            fprintf(stderr, "cannot write %s\n", options.output);
+            return 1;
+        }
+        print_json(out, options, bench::corpus_bytes(corpus), points);
+        fclose(out);
+    }
+
+    for (size_t i = 0; i < points.size(); ++i) {
+        if (!points[i].error.empty()) {
+            return 1;
+        }
+    }
+    return 0;
+}
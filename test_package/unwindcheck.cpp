@@ -0,0 +1,116 @@
+// Checks that stacks through ICU unwind, for profiling=True packages: a
+// converter callback, called from inside ucnv_toUChars(), walks the stack with
+// the frame pointers (as sampling profilers do) and with the unwind tables
+// (backtrace()), and expects an ICU frame followed by its caller call_into_icu().
+//
+//    unwindcheck [--verbose]
+
+#include <dlfcn.h>
+#include <execinfo.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+
+#include <string>
+#include <vector>
+
+#include "unicode/ucnv.h"
+#include "unicode/ucnv_err.h"
+
+extern "C" int call_into_icu(void);
+
+namespace {
+
+std::vector<void *> fpFrames;
+std::vector<void *> unwindFrames;
+
+__attribute__((noinline)) void walk_frame_pointers(std::vector<void *> &frames) {
+    void **fp = (void **)__builtin_frame_address(0);
+    for (int depth = 0; fp != NULL && depth < 64; ++depth) {
+        void *ret = fp[1];
+        if (ret == NULL) {
+            break;
+        }
+        frames.push_back(ret);
+        void **next = (void **)fp[0];
+        // saved frame pointers go up the stack, anything else is a function without one
+        if (next <= fp || (char *)next - (char *)fp > 1024 * 1024 || ((uintptr_t)next % sizeof(void *)) != 0) {
+            break;
+        }
+        fp = next;
+    }
+}
+
+void U_CALLCONV record_stack(const void *context, UConverterToUnicodeArgs *args, const char *codeUnits,
+                             int32_t length, UConverterCallbackReason reason, UErrorCode *pErrorCode) {
+    if (reason <= UCNV_IRREGULAR && fpFrames.empty()) {
+        walk_frame_pointers(fpFrames);
+        unwindFrames.resize(64);
+        unwindFrames.resize(backtrace(unwindFrames.data(), (int)unwindFrames.size()));
+    }
+    UCNV_TO_U_CALLBACK_SUBSTITUTE(context, args, codeUnits, length, reason, pErrorCode);
+}
+
+std::string describe(void *address, bool *icu) {
+    Dl_info info;
+    memset(&info, 0, sizeof(info));
+    dladdr(address, &info);
+    std::string name = info.dli_sname ? info.dli_sname : "?";
+    std::string file = info.dli_fname ? info.dli_fname : "?";
+    // ICU's C functions (ucnv_*, u_*...) and its C++ namespace (icu_60::...), or an ICU shared library
+    *icu = name.compare(0, 4, "ucnv") == 0 || name.compare(0, 2, "u_") == 0 || name.find("icu_") != std::string::npos ||
+           file.find("libicu") != std::string::npos;
+    return name + " (" + file + ")";
+}
+
+// true when an ICU frame is followed by call_into_icu()
+bool check(const char *method, const std::vector<void *> &frames, bool verbose) {
+    bool sawIcu = false;
+    bool ok = false;
+    for (size_t i = 0; i < frames.size() && !ok; ++i) {
+        bool icu = false;
+        std::string frame = describe(frames[i], &icu);
+        if (verbose) {
+            printf("  %s #%lu %s\n", method, (unsigned long)i, frame.c_str());
+        }
+        sawIcu = sawIcu || icu;
+        ok = sawIcu && frame.compare(0, 13, "call_into_icu") == 0;
+    }
+    printf("%s: %s (%lu frames)\n", method, ok ? "unwinds through ICU" : "FAILED to unwind through ICU",
+           (unsigned long)frames.size());
+    return ok;
+}
+
+} // namespace
+
+extern "C" __attribute__((noinline)) int call_into_icu(void) {
+    UErrorCode status = U_ZERO_ERROR;
+    UConverter *cnv = ucnv_open("UTF-8", &status);
+    if (U_FAILURE(status)) {
+        fprintf(stderr, "ucnv_open: %s\n", u_errorName(status));
+        return 0;
+    }
+    ucnv_setToUCallBack(cnv, record_stack, NULL, NULL, NULL, &status);
+
+    // an invalid UTF-8 byte makes the converter call record_stack()
+    const char input[] = "abc\xff" "def";
+    UChar output[32];
+    int32_t length = ucnv_toUChars(cnv, output, 32, input, (int32_t)strlen(input), &status);
+    ucnv_close(cnv);
+    if (U_FAILURE(status)) {
+        fprintf(stderr, "ucnv_toUChars: %s\n", u_errorName(status));
+        return 0;
+    }
+    return length;
+}
+
+int main(int argc, const char *argv[]) {
+    bool verbose = argc > 1 && !strcmp(argv[1], "--verbose");
+    if (call_into_icu() == 0 || fpFrames.empty()) {
+        fprintf(stderr, "the converter callback wasn't called\n");
+        return 1;
+    }
+    bool framePointers = check("frame pointers", fpFrames, verbose);
+    bool unwindTables = check("unwind tables", unwindFrames, verbose);
+    return framePointers && unwindTables ? 0 : 1;
+}